@@ -0,0 +1,42 @@
+import os
+
+# Set ANTHROPIC_BASE_URL to point the pipeline at another endpoint, e.g. a local
+# mock_server.py (ANTHROPIC_BASE_URL=http://127.0.0.1:8765) for offline runs
+API_KEY = os.environ.get("ANTHROPIC_API_KEY", "your-api-key-here")
+BASE_URL = os.environ.get("ANTHROPIC_BASE_URL")
+
+def create_client(base_url=None, **kwargs):
+    """Synchronous Anthropic client for the configured key and base URL"""
+    from anthropic import Anthropic
+    return Anthropic(api_key=API_KEY, base_url=base_url or BASE_URL, **kwargs)
+
+def create_async_client(base_url=None, **kwargs):
+    """Async Anthropic client for the configured key and base URL"""
+    from anthropic import AsyncAnthropic
+    return AsyncAnthropic(api_key=API_KEY, base_url=base_url or BASE_URL, **kwargs)
+
+# Clients are created on first use, so modules can be imported (and offline
+# commands run) without loading the SDK or needing a key
+_client = None
+_async_clients = {}
+
+def get_client():
+    """Shared synchronous client"""
+    global _client
+    if _client is None:
+        _client = create_client()
+    return _client
+
+def get_async_client(**kwargs):
+    """Shared async client for the running event loop
+
+    Connection pools belong to the loop they were opened on, so each
+    asyncio.run() gets its own client.
+    """
+    import asyncio
+    loop = asyncio.get_running_loop()
+    key = tuple(sorted(kwargs.items()))
+    cached = _async_clients.get(key)
+    if cached is None or cached[0] is not loop:
+        cached = _async_clients[key] = (loop, create_async_client(**kwargs))
+    return cached[1]
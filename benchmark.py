@@ -0,0 +1,262 @@
+import io
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import resource
+import contextlib
+import multiprocessing
+from datetime import datetime, timezone
+
+try:
+    from PIL import Image
+except ImportError:  # Without Pillow the synthetic images are random bytes
+    Image = None
+
+# Reproducible per-stage benchmarks on synthetic data. Every stage runs in a
+# fresh child process against a local mock_server.py, so peak RSS is per stage
+# and no real API calls are made:
+#   python benchmark.py --sizes 1000 10000 --report benchmark_report.json
+
+STAGES = ('build', 'submit', 'download', 'parse', 'parse_columnar')
+DEFAULT_WORKDIR = ".benchmark"
+DEFAULT_REPORT = "benchmark_report.json"
+
+TEMPLATE_COUNT = 16  # Distinct base images; every file gets a unique suffix on top
+
+def make_templates(image_size, seed):
+    """A few distinct JPEG byte strings of roughly realistic size"""
+    rng = random.Random(seed)
+    templates = []
+    for _ in range(TEMPLATE_COUNT):
+        if Image is None:
+            templates.append(rng.randbytes(image_size[0] * image_size[1] // 4))
+            continue
+        noise = Image.frombytes('L', image_size, rng.randbytes(image_size[0] * image_size[1]))
+        image = Image.merge('RGB', (noise, noise.rotate(90, expand=False), noise.transpose(Image.FLIP_LEFT_RIGHT)))
+        buffer = io.BytesIO()
+        image.save(buffer, format='JPEG', quality=85)
+        templates.append(buffer.getvalue())
+    return templates
+
+def synthetic_filename(index, rng):
+    """Dataset-style name with ground truth encoded: image_<id>_<lat>_<lon>.jpg"""
+    return f"image_{index}_{rng.uniform(-60, 70):.4f}_{rng.uniform(-180, 180):.4f}.jpg"
+
+def make_image_folder(folder, count, image_size=(640, 480), seed=0):
+    """Write count synthetic images; reuses the folder if it already holds them"""
+    os.makedirs(folder, exist_ok=True)
+    if len(os.listdir(folder)) == count:
+        return folder
+    shutil.rmtree(folder)
+    os.makedirs(folder)
+    templates = make_templates(image_size, seed)
+    rng = random.Random(seed)
+    for i in range(count):
+        # Bytes after the JPEG end marker are ignored by decoders but make every file's hash unique
+        data = templates[i % TEMPLATE_COUNT] + i.to_bytes(8, 'little')
+        with open(os.path.join(folder, synthetic_filename(i, rng)), 'wb') as f:
+            f.write(data)
+    return folder
+
+def make_results_file(results_file, mapping_file, count, error_rate=0.02, unparseable_rate=0.02, seed=0):
+    """Write a results JSONL in the stored format plus its filename mapping"""
+    from mock_server import fake_answer
+    rng = random.Random(seed)
+    mapping = {}
+    with open(results_file, 'w') as f:
+        for i in range(count):
+            custom_id = f"geo_{i}_{rng.getrandbits(32):08x}"
+            mapping[custom_id] = synthetic_filename(i, rng)
+            roll = rng.random()
+            if roll < error_rate:
+                result = {'type': 'error', 'error': {'type': 'api_error', 'message': 'Synthetic error'}}
+            else:
+                text = "I cannot determine the location." if roll < error_rate + unparseable_rate \
+                    else fake_answer(custom_id, seed)
+                result = {'type': 'message', 'content': [{'type': 'text', 'text': text}]}
+            f.write(json.dumps({'custom_id': custom_id, 'result': result}) + '\n')
+    with open(mapping_file, 'w') as f:
+        json.dump(mapping, f)
+    return results_file
+
+# Stages: each returns (items processed, bytes processed) for the timed part only
+
+def stage_build(ctx):
+    from main import create_batch_requests, request_size
+    start = time.perf_counter()
+    requests = create_batch_requests(ctx['image_folder'])
+    elapsed = time.perf_counter() - start
+    return elapsed, len(requests), sum(request_size(req) for req in requests)
+
+def stage_submit(ctx):
+    import asyncio
+    from main import iter_batch_requests, submit_batch_chunks_async
+    requests = list(iter_batch_requests(ctx['image_folder'], mapping_file=None))
+    start = time.perf_counter()
+    batch_ids, failed = asyncio.run(submit_batch_chunks_async(
+        requests, max_batch_requests=ctx['batch_requests'], base_delay=0.05))
+    elapsed = time.perf_counter() - start
+    with open(ctx['batch_ids_file'], 'w') as f:
+        json.dump(batch_ids, f)
+    return elapsed, sum(b['request_count'] for b in batch_ids), sum(b['payload_bytes'] for b in batch_ids)
+
+def stage_download(ctx):
+    from check_status import download_all_results
+    with open(ctx['batch_ids_file']) as f:
+        batch_ids = json.load(f)
+    output_file = ctx['downloaded_file']
+    if os.path.exists(output_file):
+        os.remove(output_file)
+    start = time.perf_counter()
+    download_all_results(batch_ids, output_file)
+    elapsed = time.perf_counter() - start
+    with open(output_file) as f:
+        count = sum(1 for _ in f)
+    return elapsed, count, os.path.getsize(output_file)
+
+def stage_parse(ctx):
+    from check_status import parse_results
+    start = time.perf_counter()
+    coordinates = parse_results(ctx['results_file'], ctx['mapping_file'])
+    elapsed = time.perf_counter() - start
+    return elapsed, len(coordinates), os.path.getsize(ctx['results_file'])
+
+def stage_parse_columnar(ctx):
+    from evaluate import load_predictions
+    start = time.perf_counter()
+    table = load_predictions(ctx['results_file'], ctx['mapping_file'])
+    elapsed = time.perf_counter() - start
+    return elapsed, len(table['custom_id']), os.path.getsize(ctx['results_file'])
+
+STAGE_FUNCTIONS = {
+    'build': stage_build,
+    'submit': stage_submit,
+    'download': stage_download,
+    'parse': stage_parse,
+    'parse_columnar': stage_parse_columnar,
+}
+
+def peak_rss_mb():
+    """Peak resident set size of this process and its reaped children, in MB
+
+    Uses VmHWM on Linux because ru_maxrss survives exec, so a spawned child
+    would otherwise report its parent's peak (the parent hosts the mock server).
+    """
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    try:
+        with open('/proc/self/status') as f:
+            own = next(int(line.split()[1]) for line in f if line.startswith('VmHWM:'))
+    except (OSError, StopIteration):
+        own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    scale = 1 if sys.platform == 'darwin' else 1024  # ru_maxrss is bytes on macOS, KiB elsewhere
+    return max(own, children) * scale / 1e6
+
+def run_stage_child(stage, ctx, conn):
+    try:
+        os.chdir(ctx['workdir'])
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            elapsed, items, nbytes = STAGE_FUNCTIONS[stage](ctx)
+        conn.send({'seconds': elapsed, 'items': items, 'bytes': nbytes, 'peak_rss_mb': peak_rss_mb()})
+    except Exception as e:
+        conn.send({'error': f"{type(e).__name__}: {e}"})
+    finally:
+        conn.close()
+
+def run_stage(stage, ctx):
+    """Run one stage in a fresh interpreter; returns its measurements
+
+    spawn rather than fork, so the child's peak RSS does not start from the
+    parent's (which holds the synthetic data generation).
+    """
+    mp = multiprocessing.get_context('spawn')
+    parent_conn, child_conn = mp.Pipe(duplex=False)
+    process = mp.Process(target=run_stage_child, args=(stage, ctx, child_conn))
+    process.start()
+    child_conn.close()
+    try:
+        measurement = parent_conn.recv()
+    except EOFError:
+        measurement = {'error': 'stage process died'}
+    process.join()
+    if 'error' not in measurement:
+        seconds = measurement['seconds'] or 1e-9
+        measurement['items_per_sec'] = measurement['items'] / seconds
+        measurement['mb_per_sec'] = measurement['bytes'] / 1e6 / seconds
+    return measurement
+
+def run_benchmarks(sizes=(1000,), stages=STAGES, workdir=DEFAULT_WORKDIR, report_file=DEFAULT_REPORT,
+                   image_size=(640, 480), batch_requests=1000, port=8766, seed=0):
+    """Run every stage at every size and write a JSON report"""
+    from mock_server import serve
+
+    workdir = os.path.abspath(workdir)
+    # No processing delay: download measures transfer and parsing, not waiting
+    server, _ = serve(port=port, processing_delay=0.0)
+    # Stage processes build their client on first use (api_client.get_client), from ANTHROPIC_BASE_URL
+    os.environ['ANTHROPIC_BASE_URL'] = f"http://127.0.0.1:{port}"
+
+    results = []
+    try:
+        for size in sizes:
+            size_dir = os.path.join(workdir, str(size))
+            os.makedirs(size_dir, exist_ok=True)
+            ctx = {
+                'workdir': size_dir,
+                'image_folder': os.path.join(size_dir, 'images'),
+                'batch_ids_file': os.path.join(size_dir, 'batch_ids.json'),
+                'downloaded_file': os.path.join(size_dir, 'downloaded_results.jsonl'),
+                'results_file': os.path.join(size_dir, 'synthetic_results.jsonl'),
+                'mapping_file': os.path.join(size_dir, 'synthetic_mapping.json'),
+                'batch_requests': batch_requests,
+            }
+            print(f"\n📊 Size {size}: generating synthetic data in {size_dir}")
+            if {'build', 'submit'} & set(stages):
+                make_image_folder(ctx['image_folder'], size, image_size, seed)
+            if {'parse', 'parse_columnar'} & set(stages):
+                make_results_file(ctx['results_file'], ctx['mapping_file'], size, seed=seed)
+
+            for stage in stages:
+                measurement = run_stage(stage, ctx)
+                results.append({'size': size, 'stage': stage, **measurement})
+                if 'error' in measurement:
+                    print(f"❌ {stage:<15} {measurement['error']}")
+                else:
+                    print(f"⚡ {stage:<15} {measurement['seconds']:8.2f}s  {measurement['items_per_sec']:10.0f} items/s  "
+                          f"{measurement['mb_per_sec']:8.1f} MB/s  peak RSS {measurement['peak_rss_mb']:.0f} MB")
+    finally:
+        server.shutdown()
+
+    report = {
+        'created_at': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'pillow': Image is not None,
+        'config': {'sizes': list(sizes), 'stages': list(stages), 'image_size': list(image_size),
+                   'batch_requests': batch_requests, 'seed': seed},
+        'results': results,
+    }
+    with open(report_file, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\n📁 Benchmark report saved to {report_file}")
+    return report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark each pipeline stage on synthetic data")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000], help="e.g. 1000 10000 100000")
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=list(STAGES))
+    parser.add_argument('--workdir', default=DEFAULT_WORKDIR)
+    parser.add_argument('--report', default=DEFAULT_REPORT)
+    parser.add_argument('--image-size', type=int, nargs=2, default=[640, 480], metavar=('WIDTH', 'HEIGHT'))
+    parser.add_argument('--batch-requests', type=int, default=1000, help="requests per submitted batch")
+    parser.add_argument('--port', type=int, default=8766, help="port for the mock Batches API")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    run_benchmarks(args.sizes, args.stages, args.workdir, args.report, tuple(args.image_size),
+                   args.batch_requests, args.port, args.seed)
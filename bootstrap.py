@@ -0,0 +1,197 @@
+import numpy as np
+
+from evaluate import summarize, THRESHOLDS_KM
+
+DEFAULT_REPLICATES = 10_000
+DEFAULT_CONFIDENCE = 0.95
+BLOCK_ELEMENTS = 4_000_000  # Replicates x rows drawn per block, bounding memory at a few tens of MB
+
+# Resampling
+#
+# A bootstrap resample is represented by how many times each row was drawn
+# (a replicates x rows count matrix) rather than by the resampled values. Every
+# statistic then comes from the original arrays, sorted once: accuracies and
+# means are matrix products with the counts, and medians are read from running
+# count totals along the sorted distances. No per-replicate sort and no Python
+# loop over replicates.
+
+def resample_counts(n, replicates, rng):
+    """(replicates, n) array: how often each of n rows is drawn in each resample"""
+    draws = rng.integers(0, n, size=(replicates, n))
+    draws += np.arange(replicates)[:, None] * n
+    return np.bincount(draws.ravel(), minlength=replicates * n).reshape(replicates, n)
+
+def replicate_statistics(counts, distance_km, thresholds=THRESHOLDS_KM):
+    """Median/mean error and threshold accuracies of every resample in counts
+
+    Same definitions as evaluate.summarize: accuracy is over all rows (nan
+    distances count as misses), median and mean over parsed rows only.
+    Returns a dict shaped like summarize's, with one value per replicate.
+    """
+    distance_km = np.asarray(distance_km, dtype=np.float64)
+    replicates, n = counts.shape
+    parsed = np.flatnonzero(~np.isnan(distance_km))
+    order = parsed[np.argsort(distance_km[parsed], kind='stable')]
+    sorted_km = distance_km[order]
+    sorted_counts = counts[:, order]
+    n_parsed = sorted_counts.sum(axis=1)
+
+    stats = {
+        'median_km': np.full(replicates, np.nan),
+        'mean_km': np.full(replicates, np.nan),
+        'accuracy': {},
+    }
+    has_parsed = n_parsed > 0
+    if len(order):
+        cumulative = np.cumsum(sorted_counts, axis=1)
+
+        def value_at_rank(rank):
+            # The rank-th smallest resampled distance (0-based): first position whose running total exceeds it
+            position = np.count_nonzero(cumulative <= rank[:, None], axis=1)
+            return sorted_km[np.minimum(position, len(order) - 1)]
+
+        lower = value_at_rank((n_parsed - 1) // 2)
+        upper = value_at_rank(n_parsed // 2)
+        stats['median_km'][has_parsed] = ((lower + upper) / 2)[has_parsed]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            stats['mean_km'][has_parsed] = (sorted_counts @ sorted_km / n_parsed)[has_parsed]
+
+    hits = np.column_stack([sorted_km <= t for t in thresholds]).astype(np.float64) if len(order) \
+        else np.zeros((0, len(thresholds)))
+    accuracy = sorted_counts @ hits / n if n else np.full((replicates, len(thresholds)), np.nan)
+    for i, threshold in enumerate(thresholds):
+        stats['accuracy'][f'{threshold}km'] = accuracy[:, i]
+    return stats
+
+def bootstrap_statistics(distance_arrays, replicates=DEFAULT_REPLICATES, seed=0, thresholds=THRESHOLDS_KM):
+    """Replicate statistics for one or more aligned distance arrays
+
+    All arrays are resampled with the same draws, which makes the replicates
+    paired when the arrays hold two runs over the same images. Returns one
+    replicate_statistics dict per array.
+    """
+    rng = np.random.default_rng(seed)
+    n = len(distance_arrays[0])
+    block = max(1, BLOCK_ELEMENTS // max(n, 1))
+    blocks = [[] for _ in distance_arrays]
+    for start in range(0, replicates, block):
+        counts = resample_counts(n, min(block, replicates - start), rng)
+        for stats, distance_km in zip(blocks, distance_arrays):
+            stats.append(replicate_statistics(counts, distance_km, thresholds))
+    return [
+        {
+            'median_km': np.concatenate([s['median_km'] for s in stats]),
+            'mean_km': np.concatenate([s['mean_km'] for s in stats]),
+            'accuracy': {name: np.concatenate([s['accuracy'][name] for s in stats]) for name in stats[0]['accuracy']},
+        }
+        for stats in blocks
+    ]
+
+def interval(estimate, samples, confidence=DEFAULT_CONFIDENCE):
+    """Percentile interval of replicate samples around a point estimate"""
+    samples = samples[~np.isnan(samples)]
+    if estimate is None or len(samples) == 0:
+        return {'estimate': estimate, 'low': None, 'high': None}
+    tail = (1 - confidence) / 2 * 100
+    low, high = np.percentile(samples, [tail, 100 - tail])
+    return {'estimate': estimate, 'low': float(low), 'high': float(high)}
+
+# Confidence intervals for one run
+
+def bootstrap_summary(distance_km, replicates=DEFAULT_REPLICATES, confidence=DEFAULT_CONFIDENCE, seed=0,
+                      thresholds=THRESHOLDS_KM):
+    """summarize() metrics with percentile bootstrap intervals
+
+    Returns {'median_km', 'mean_km', 'accuracy': {'<t>km'}} where each value is
+    a {'estimate', 'low', 'high'} dict, plus the replicate count and confidence.
+    """
+    point = summarize(distance_km, thresholds=thresholds)
+    stats, = bootstrap_statistics([distance_km], replicates, seed, thresholds)
+    return {
+        'total': point['total'],
+        'replicates': replicates,
+        'confidence': confidence,
+        'median_km': interval(point['median_km'], stats['median_km'], confidence),
+        'mean_km': interval(point['mean_km'], stats['mean_km'], confidence),
+        'accuracy': {name: interval(value, stats['accuracy'][name], confidence)
+                     for name, value in point['accuracy'].items()},
+    }
+
+def print_bootstrap_summary(summary):
+    print(f"📏 {summary['confidence']:.0%} bootstrap intervals ({summary['replicates']:,} replicates)")
+    for label, key in (('Median error', 'median_km'), ('Mean error', 'mean_km')):
+        ci = summary[key]
+        if ci['low'] is not None:
+            print(f"   {label + ':':<14} {ci['estimate']:8.1f} km  [{ci['low']:.1f}, {ci['high']:.1f}]")
+    for name, ci in summary['accuracy'].items():
+        if ci['low'] is not None:
+            print(f"   Accuracy @ {name:>6}: {ci['estimate']:7.2%}  [{ci['low']:.2%}, {ci['high']:.2%}]")
+
+# Paired comparison of two runs
+
+def pair_tables(baseline, candidate):
+    """(custom_ids, baseline distances, candidate distances) for the images both tables scored"""
+    custom_ids, base_rows, cand_rows = np.intersect1d(baseline['custom_id'].astype(str),
+                                                      candidate['custom_id'].astype(str), return_indices=True)
+    return custom_ids, baseline['distance_km'][base_rows], candidate['distance_km'][cand_rows]
+
+def paired_difference(estimate_a, estimate_b, samples_a, samples_b, confidence):
+    """Interval of b - a, plus the two-sided bootstrap p-value of no difference"""
+    estimate = None if estimate_a is None or estimate_b is None else estimate_b - estimate_a
+    difference = samples_b - samples_a
+    result = interval(estimate, difference, confidence)
+    difference = difference[~np.isnan(difference)]
+    result['p_value'] = (float(min(1.0, 2 * min(np.mean(difference <= 0), np.mean(difference >= 0))))
+                         if len(difference) else None)
+    return result
+
+def compare_runs(baseline, candidate, replicates=DEFAULT_REPLICATES, confidence=DEFAULT_CONFIDENCE, seed=0,
+                 thresholds=THRESHOLDS_KM):
+    """Paired bootstrap comparison of two joined tables (see evaluate.load_predictions)
+
+    Only images present in both runs are compared, and every replicate draws
+    the same images for both, so per-image difficulty cancels out of the
+    differences. Each metric gets baseline and candidate values and the
+    interval and p-value of candidate - baseline.
+    """
+    custom_ids, base_km, cand_km = pair_tables(baseline, candidate)
+    base_point = summarize(base_km, thresholds=thresholds)
+    cand_point = summarize(cand_km, thresholds=thresholds)
+    base_stats, cand_stats = bootstrap_statistics([base_km, cand_km], replicates, seed, thresholds)
+
+    def compare(get):
+        return dict(baseline=get(base_point), candidate=get(cand_point),
+                    **paired_difference(get(base_point), get(cand_point), get(base_stats), get(cand_stats),
+                                        confidence))
+
+    return {
+        'paired': len(custom_ids),
+        'baseline_only': len(baseline['custom_id']) - len(custom_ids),
+        'candidate_only': len(candidate['custom_id']) - len(custom_ids),
+        'replicates': replicates,
+        'confidence': confidence,
+        'median_km': compare(lambda s: s['median_km']),
+        'mean_km': compare(lambda s: s['mean_km']),
+        'accuracy': {name: compare(lambda s, name=name: s['accuracy'][name]) for name in base_point['accuracy']},
+    }
+
+def print_comparison(comparison, baseline_name="baseline", candidate_name="candidate"):
+    """Differences are candidate - baseline; * marks intervals that exclude zero"""
+    print(f"⚖️  {candidate_name} vs {baseline_name} on {comparison['paired']:,} shared images "
+          f"({comparison['confidence']:.0%} paired bootstrap, {comparison['replicates']:,} replicates)")
+    if comparison['baseline_only'] or comparison['candidate_only']:
+        print(f"   Not compared: {comparison['baseline_only']} images only in {baseline_name}, "
+              f"{comparison['candidate_only']} only in {candidate_name}")
+
+    def marker(c):
+        return '*' if c['low'] is not None and (c['low'] > 0 or c['high'] < 0) else ' '
+
+    for label, key in (('Median error', 'median_km'), ('Mean error', 'mean_km')):
+        c = comparison[key]
+        if c['low'] is not None:
+            print(f"   {label + ':':<14} {c['baseline']:8.1f} -> {c['candidate']:8.1f} km  "
+                  f"Δ {c['estimate']:+8.1f} [{c['low']:+.1f}, {c['high']:+.1f}] {marker(c)} p={c['p_value']:.3f}")
+    for name, c in comparison['accuracy'].items():
+        if c['low'] is not None:
+            print(f"   Accuracy @ {name:>6}: {c['baseline']:7.2%} -> {c['candidate']:7.2%}  "
+                  f"Δ {c['estimate']:+7.2%} [{c['low']:+.2%}, {c['high']:+.2%}] {marker(c)} p={c['p_value']:.3f}")
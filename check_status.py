@@ -1,8 +1,16 @@
+import os
+import sys
 import json
-from anthropic import Anthropic
+import time
+import shutil
+import asyncio
+from threading import Lock
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from api_client import get_client, get_async_client
+from mapping_store import load_filename_mapping, FilenameMapping
+from metrics import metrics
 
-# Initialize the Anthropic client
-client = Anthropic(api_key="your-api-key-here")
+MAX_POLL_FAILURES = 5  # Consecutive failed polls before watch gives up on a batch
 
 def check_all_batches_status(batch_ids):
     """Check status of all batch chunks"""
@@ -18,7 +26,8 @@ def check_all_batches_status(batch_ids):
         chunk_num = batch_info['chunk_num']
         
         try:
-            batch = client.beta.messages.batches.retrieve(batch_id)
+            with metrics.timer('poll_request'):
+                batch = get_client().beta.messages.batches.retrieve(batch_id)
             print(f"Chunk {chunk_num} (ID: {batch_id[:12]}...):")
             print(f"  Status: {batch.processing_status}")
             
@@ -43,6 +52,7 @@ def check_all_batches_status(batch_ids):
             
         except Exception as e:
             print(f"Error checking batch {batch_id}: {e}")
+            metrics.count('poll_errors')
             all_ended = False
     
     print(f"TOTALS:")
@@ -53,88 +63,326 @@ def check_all_batches_status(batch_ids):
     
     return all_ended
 
-def download_all_results(batch_ids, output_file="geolocation_results.jsonl"):
-    """Download results from all batch chunks"""
-    all_results = []
+def result_to_dict(result):
+    """Convert a batch result object to a JSON-serializable dictionary"""
+    result_dict = {
+        'custom_id': result.custom_id,
+        'result': {}
+    }
+    
+    # Check if this is a successful result
+    if hasattr(result, 'result') and hasattr(result.result, 'message'):
+        # Successful message result
+        message = result.result.message
+        result_dict['result'] = {
+            'type': 'message',
+            'content': []
+        }
+        
+        # Extract content from the message
+        if hasattr(message, 'content'):
+            for content_item in message.content:
+                if hasattr(content_item, 'text'):
+                    result_dict['result']['content'].append({
+                        'type': 'text',
+                        'text': content_item.text
+                    })
+    elif hasattr(result, 'result') and hasattr(result.result, 'error'):
+        # Error result
+        error = result.result.error
+        result_dict['result'] = {
+            'type': 'error',
+            'error': {
+                'type': getattr(error, 'type', 'unknown'),
+                'message': getattr(error, 'message', str(error))
+            }
+        }
+    else:
+        # Fallback - try to get any available data
+        result_dict['result'] = {
+            'type': 'unknown',
+            'raw_result': str(result.result) if hasattr(result, 'result') else 'no_result'
+        }
+    
+    return result_dict
+
+def download_batch_results(batch_info, out, write_lock, flush_every=500):
+    """Stream one batch's results into an open JSONL file, flushing every flush_every lines
+
+    Returns the number of results written, or None if the batch has not ended yet.
+    Only flush_every converted lines are buffered, however large the batch is.
+    """
+    batch_id = batch_info['batch_id']
+    chunk_num = batch_info['chunk_num']
+    started = time.perf_counter()
+    
+    batch = get_client().beta.messages.batches.retrieve(batch_id)
+    
+    if batch.processing_status != "ended":
+        print(f"Chunk {chunk_num} not ready yet. Status: {batch.processing_status}")
+        return None
+    
+    count = 0
+    buffer = []
+    
+    def flush():
+        # Whole lines are written under the lock so parallel downloads never interleave
+        with write_lock:
+            out.write(''.join(buffer))
+            out.flush()
+        buffer.clear()
+    
+    # Results stream from the API as JSONL; never materialize the whole batch
+    for result in get_client().beta.messages.batches.results(batch_id):
+        buffer.append(json.dumps(result_to_dict(result)) + '\n')
+        count += 1
+        if len(buffer) >= flush_every:
+            flush()
+    if buffer:
+        flush()
+    
+    record_downloaded(batch_id, count, time.perf_counter() - started)
+    return count
+
+def record_downloaded(batch_id, count, seconds):
+    metrics.observe('download_batch', seconds)
+    metrics.count('batches_downloaded')
+    metrics.count('results_downloaded', count)
+    metrics.event('batch_downloaded', batch_id=batch_id, result_count=count, seconds=round(seconds, 3))
+
+def commit_batch_part(part_path, output_file, batch_id, count, manifest=None, store=None):
+    """Append a fully downloaded batch to the results file and checkpoint it in the manifest
+
+    With a ResultsStore, the batch is also merged into it under its batch ID
+    first; merging is idempotent, so a crash before the manifest checkpoint
+    only means the batch is merged again on the next download.
+    """
+    if store is not None:
+        store.merge_jsonl(part_path, run_id=batch_id)
+        store.flush()
+    with open(part_path, 'rb') as part, open(output_file, 'ab') as out:
+        shutil.copyfileobj(part, out)
+        out.flush()
+        os.fsync(out.fileno())
+        results_offset = out.tell()
+    if manifest is not None:
+        manifest.record_download(batch_id, count, results_offset)
+    os.remove(part_path)
+
+def download_all_results(batch_ids, output_file="geolocation_results.jsonl", workers=4, flush_every=500,
+                         manifest=None, store=None):
+    """Download results from all batch chunks, streaming them to disk as they arrive
+
+    Up to workers batches download in parallel. Results are appended to
+    output_file in blocks of flush_every lines, so memory stays flat and
+    everything downloaded before a crash is already on disk.
+    
+    With a RunManifest, batches already downloaded are skipped and new results
+    are appended. Each batch is staged in a .part file and only appended to
+    output_file once complete, so an interrupted download never leaves
+    duplicate or partial results behind.
+
+    With a ResultsStore, each completed batch is also merged into the store
+    (see commit_batch_part), which keeps the best result per custom_id across
+    every run and retry.
+    """
+    total_results = 0
+    write_lock = Lock()
+    
+    if manifest is not None:
+        # Trim (or, if results were lost, reset) the results file before deciding what is already downloaded
+        manifest.prepare_results_file(output_file)
+        done = [b for b in batch_ids if manifest.is_downloaded(b['batch_id'])]
+        batch_ids = [b for b in batch_ids if not manifest.is_downloaded(b['batch_id'])]
+        if done:
+            print(f"Skipping {len(done)} batches already downloaded")
+    
+    # Without a manifest the results file starts fresh; batches are staged only if a store needs them whole
+    staged = manifest is not None or store is not None
+    if manifest is None and store is not None:
+        open(output_file, 'w').close()
     
     print("Downloading results from all batches...\n")
     
-    for batch_info in batch_ids:
-        batch_id = batch_info['batch_id']
-        chunk_num = batch_info['chunk_num']
-        
+    def download(batch_info, out):
+        if not staged:
+            return download_batch_results(batch_info, out, write_lock, flush_every)
+        part_path = f"{output_file}.{batch_info['batch_id']}.part"
         try:
-            batch = client.beta.messages.batches.retrieve(batch_id)
-            
-            if batch.processing_status != "ended":
-                print(f"Chunk {chunk_num} not ready yet. Status: {batch.processing_status}")
-                continue
-            
-            # Get results for this batch
-            results = client.beta.messages.batches.results(batch_id)
-            
-            chunk_results = list(results)
-            all_results.extend(chunk_results)
-            
-            print(f"✅ Downloaded {len(chunk_results)} results from chunk {chunk_num}")
-            
-        except Exception as e:
-            print(f"❌ Error downloading chunk {chunk_num}: {e}")
-            continue
+            with open(part_path, 'w') as part:
+                count = download_batch_results(batch_info, part, Lock(), flush_every)
+            if count is None:
+                return None
+            with write_lock:
+                commit_batch_part(part_path, output_file, batch_info['batch_id'], count, manifest, store)
+            return count
+        finally:
+            # commit_batch_part removes the part file once committed; anything left is partial
+            if os.path.exists(part_path):
+                os.remove(part_path)
     
-    if all_results:
-        # Save all results to file
-        with open(output_file, 'w') as f:
-            for result in all_results:
-                # Convert the result object to a dictionary
-                result_dict = {
-                    'custom_id': result.custom_id,
-                    'result': {}
-                }
-                
-                # Check if this is a successful result
-                if hasattr(result, 'result') and hasattr(result.result, 'message'):
-                    # Successful message result
-                    message = result.result.message
-                    result_dict['result'] = {
-                        'type': 'message',
-                        'content': []
-                    }
-                    
-                    # Extract content from the message
-                    if hasattr(message, 'content'):
-                        for content_item in message.content:
-                            if hasattr(content_item, 'text'):
-                                result_dict['result']['content'].append({
-                                    'type': 'text',
-                                    'text': content_item.text
-                                })
-                elif hasattr(result, 'result') and hasattr(result.result, 'error'):
-                    # Error result
-                    error = result.result.error
-                    result_dict['result'] = {
-                        'type': 'error',
-                        'error': {
-                            'type': getattr(error, 'type', 'unknown'),
-                            'message': getattr(error, 'message', str(error))
-                        }
-                    }
-                else:
-                    # Fallback - try to get any available data
-                    result_dict['result'] = {
-                        'type': 'unknown',
-                        'raw_result': str(result.result) if hasattr(result, 'result') else 'no_result'
-                    }
+    out = open(output_file, 'w') if not staged else None
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(download, batch_info, out): batch_info for batch_info in batch_ids}
+            
+            for future in as_completed(futures):
+                chunk_num = futures[future]['chunk_num']
+                try:
+                    count = future.result()
+                except Exception as e:
+                    print(f"❌ Error downloading chunk {chunk_num}: {e}")
+                    metrics.count('download_errors')
+                    continue
                 
-                f.write(json.dumps(result_dict) + '\n')
-        
+                if count is not None:
+                    total_results += count
+                    print(f"✅ Downloaded {count} results from chunk {chunk_num}")
+    finally:
+        if out is not None:
+            out.close()
+    
+    if total_results:
         print(f"\n✅ All results saved to {output_file}")
-        print(f"Total results: {len(all_results)}")
+        print(f"Total results: {total_results}")
         return True
     else:
         print("❌ No results to save")
         return False
 
+async def download_batch_async(batch_info, out):
+    """Stream one ended batch's results into an open JSONL file, returning the result count"""
+    count = 0
+    started = time.perf_counter()
+    results = await get_async_client().beta.messages.batches.results(batch_info['batch_id'])
+    async for result in results:
+        # Each line is written in one call, so concurrent downloads never interleave within a line
+        out.write(json.dumps(result_to_dict(result)) + '\n')
+        count += 1
+    out.flush()
+    record_downloaded(batch_info['batch_id'], count, time.perf_counter() - started)
+    return count
+
+async def watch_batches(batch_ids, output_file="geolocation_results.jsonl", download=True,
+                        min_interval=10.0, max_interval=300.0, max_concurrency=16, manifest=None, store=None,
+                        max_poll_failures=MAX_POLL_FAILURES):
+    """Poll all batches concurrently until every one has ended, downloading each as soon as it ends
+
+    Batches that have ended are dropped from the poll set. The poll interval starts
+    at min_interval, backs off by 1.5x while nothing changes and resets whenever a
+    batch makes progress. A batch whose status could not be retrieved
+    max_poll_failures times in a row (e.g. a stale ID) is dropped and reported.
+    Returns True if every batch ended and downloaded cleanly.
+    With a RunManifest, already-downloaded batches are not polled again and
+    new results are committed batch by batch, as in download_all_results,
+    and merged into store if one is given.
+    """
+    semaphore = asyncio.Semaphore(max_concurrency)
+    pending = {b['batch_id']: b for b in batch_ids}
+    if manifest is not None:
+        if download:
+            manifest.prepare_results_file(output_file)
+        pending = {k: b for k, b in pending.items() if not manifest.is_downloaded(k)}
+    last_counts = {}
+    poll_failures = {}
+    commit_lock = asyncio.Lock()
+    downloads = []
+    ok = True
+    interval = min_interval
+    staged = manifest is not None or store is not None
+    if download and manifest is None and store is not None:
+        open(output_file, 'w').close()
+    out = open(output_file, 'w') if download and not staged else None
+    
+    async def poll(batch_id):
+        async with semaphore:
+            try:
+                with metrics.timer('poll_request'):
+                    return batch_id, await get_async_client().beta.messages.batches.retrieve(batch_id), None
+            except Exception as e:
+                return batch_id, None, e
+    
+    async def download_when_ended(batch_info):
+        async with semaphore:
+            if not staged:
+                count = await download_batch_async(batch_info, out)
+            else:
+                part_path = f"{output_file}.{batch_info['batch_id']}.part"
+                try:
+                    with open(part_path, 'w') as part:
+                        count = await download_batch_async(batch_info, part)
+                    # Merging, copying and fsyncing run off the loop, one batch at a time, so polls keep going
+                    async with commit_lock:
+                        await asyncio.to_thread(commit_batch_part, part_path, output_file, batch_info['batch_id'],
+                                                count, manifest, store)
+                finally:
+                    if os.path.exists(part_path):
+                        os.remove(part_path)
+        print(f"✅ Downloaded {count} results from chunk {batch_info['chunk_num']}")
+        return count
+    
+    print(f"Watching {len(pending)} batches...\n")
+    
+    try:
+        while pending:
+            polls = await asyncio.gather(*(poll(batch_id) for batch_id in pending))
+            
+            progressed = False
+            for batch_id, batch, error in polls:
+                if error is not None:
+                    metrics.count('poll_errors')
+                    poll_failures[batch_id] = poll_failures.get(batch_id, 0) + 1
+                    if poll_failures[batch_id] < max_poll_failures:
+                        print(f"Error checking batch {batch_id}: {error}")
+                        continue
+                    batch_info = pending.pop(batch_id)
+                    print(f"❌ Giving up on chunk {batch_info['chunk_num']} ({batch_id}) after "
+                          f"{poll_failures[batch_id]} failed status checks: {error}")
+                    metrics.event('batch_abandoned', batch_id=batch_id, chunk_num=batch_info['chunk_num'])
+                    ok = False
+                    continue
+                poll_failures.pop(batch_id, None)
+                counts = getattr(batch, 'request_counts', None)
+                snapshot = tuple(getattr(counts, k, 0) for k in ('processing', 'succeeded', 'errored'))
+                if last_counts.get(batch_id) != snapshot:
+                    progressed = True
+                    last_counts[batch_id] = snapshot
+                
+                if batch.processing_status == "ended":
+                    batch_info = pending.pop(batch_id)
+                    progressed = True
+                    print(f"🏁 Chunk {batch_info['chunk_num']} ({batch_id[:12]}...) ended")
+                    metrics.event('batch_ended', batch_id=batch_id, chunk_num=batch_info['chunk_num'],
+                                  succeeded=snapshot[1], errored=snapshot[2])
+                    if download:
+                        downloads.append((batch_info, asyncio.create_task(download_when_ended(batch_info))))
+            
+            # Totals over every batch seen so far, including ones that have already ended
+            processing, succeeded, errored = (sum(c[k] for c in last_counts.values()) for k in range(3))
+            print(f"⏳ {len(pending)} batches still running | processing: {processing}, "
+                  f"succeeded: {succeeded}, errored: {errored}")
+            
+            if not pending:
+                break
+            
+            # Poll fast while batches are moving, back off while they are idle
+            interval = min_interval if progressed else min(max_interval, interval * 1.5)
+            await asyncio.sleep(interval)
+        
+        outcomes = await asyncio.gather(*(task for _, task in downloads), return_exceptions=True)
+        for (batch_info, _), outcome in zip(downloads, outcomes):
+            if isinstance(outcome, Exception):
+                print(f"❌ Error downloading chunk {batch_info['chunk_num']} ({batch_info['batch_id']}): {outcome}")
+                metrics.count('download_errors')
+                ok = False
+    finally:
+        if out is not None:
+            out.close()
+    
+    if download:
+        print(f"\n{'✅ All batches ended' if ok else '⚠️  Finished with errors'}; results saved to {output_file}")
+    return ok
+
 def debug_results_structure(results_file="geolocation_results.jsonl", num_lines=3):
     """Debug function to inspect the structure of saved results"""
     print(f"Inspecting structure of {results_file}...")
@@ -156,17 +404,16 @@ def parse_results(results_file="geolocation_results.jsonl", mapping_file="filena
     """Parse results and extract coordinates, mapping back to original filenames"""
     coordinates = []
     
-    # Load filename mapping
+    # Load filename mapping (indexed store if present, else the JSON file)
     try:
-        with open(mapping_file, 'r') as f:
-            filename_mapping = json.load(f)
+        filename_mapping = load_filename_mapping(mapping_file)
     except:
         print("Warning: Could not load filename mapping. Using custom_id as filename.")
-        filename_mapping = {}
+        filename_mapping = FilenameMapping()
     
     print(f"Debug: Loading results from {results_file}")
     
-    with open(results_file, 'r') as f:
+    with filename_mapping, open(results_file, 'r') as f:
         for line_num, line in enumerate(f, 1):
             try:
                 result = json.loads(line)
@@ -208,52 +455,7 @@ def parse_results(results_file="geolocation_results.jsonl", mapping_file="filena
 
 # Main execution
 if __name__ == "__main__":
-    # Load batch IDs
-    try:
-        with open('batch_ids.json', 'r') as f:
-            batch_ids = json.load(f)
-        print(f"Loaded {len(batch_ids)} batch chunks from batch_ids.json\n")
-    except FileNotFoundError:
-        print("❌ batch_ids.json not found. Make sure you're in the right directory.")
-        exit()
-    except Exception as e:
-        print(f"❌ Error loading batch_ids.json: {e}")
-        exit()
-    
-    # Check status
-    print("=" * 50)
-    print("CHECKING BATCH STATUS")
-    print("=" * 50)
-    all_complete = check_all_batches_status(batch_ids)
-    
-    if all_complete:
-        print("\n🎉 All batches are complete!")
-        
-        # Ask if user wants to download results
-        download = input("\nDownload results now? (y/n): ").lower().strip()
-        if download in ['y', 'yes']:
-            print("\n" + "=" * 50)
-            print("DOWNLOADING RESULTS")
-            print("=" * 50)
-            success = download_all_results(batch_ids)
-            
-            if success:
-                print("\n" + "=" * 50)
-                print("PARSING RESULTS")
-                print("=" * 50)
-                coordinates = parse_results()
-                print(f"\nParsed {len(coordinates)} results")
-                
-                # Show first few results as preview
-                print("\nFirst 3 results:")
-                for i, coord in enumerate(coordinates[:3]):
-                    print(f"  {i+1}. {coord['filename']}")
-                    print(f"     {coord['response']}")
-                    print()
-    else:
-        print("\n⏳ Some batches are still processing. Run this script again later.")
-    
-    print("\nAvailable functions:")
-    print("- check_all_batches_status(batch_ids)")
-    print("- download_all_results(batch_ids)")
-    print("- parse_results('geolocation_results.jsonl', 'filename_mapping.json')")
+    # python check_status.py        -> python cli.py download  (downloads every batch that has ended)
+    # python check_status.py watch  -> python cli.py watch
+    from cli import main
+    sys.exit(main(['watch' if sys.argv[1:2] == ['watch'] else 'download']))
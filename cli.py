@@ -0,0 +1,431 @@
+import os
+import sys
+import json
+import argparse
+
+# Single entry point for the whole pipeline:
+#   python cli.py plan <image_folder>      predict request sizes, batches and timings without encoding
+#   python cli.py build <image_folder>     encode images (warms the cache and mapping store)
+#   python cli.py submit <image_folder>    build and submit batches
+#   python cli.py retry <image_folder>     resubmit only failed or unparseable results
+#   python cli.py status                   check batch status once
+#   python cli.py watch                    poll until every batch ends, downloading as they finish
+#   python cli.py download                 download every batch that has ended
+#   python cli.py merge <results.jsonl>    merge results files into the results store
+#   python cli.py evaluate                 score results against ground truth
+#   python cli.py compare <a> <b>          paired bootstrap comparison of two runs
+#
+# Subcommands import the network and imaging modules they need only when they
+# run, so offline commands such as evaluate never load the SDK or Pillow.
+# Nothing prompts for input, so every command can run from a job scheduler.
+
+BATCH_IDS_FILE = "batch_ids.json"
+FAILED_CHUNKS_FILE = "failed_chunks.json"
+
+def load_batch_ids(manifest_file=None):
+    """Batch IDs from the run manifest if there is one, else from batch_ids.json"""
+    from manifest import RunManifest, DEFAULT_MANIFEST_FILE
+    manifest_file = manifest_file or DEFAULT_MANIFEST_FILE
+    if os.path.exists(manifest_file):
+        manifest = RunManifest(manifest_file)
+        print(f"📋 Run manifest: {manifest.summary()}\n")
+        return manifest.batch_ids(), manifest
+    try:
+        with open(BATCH_IDS_FILE, 'r') as f:
+            batch_ids = json.load(f)
+    except FileNotFoundError:
+        raise SystemExit(f"❌ Neither {manifest_file} nor {BATCH_IDS_FILE} found. "
+                         "Make sure you're in the right directory.")
+    print(f"Loaded {len(batch_ids)} batch chunks from {BATCH_IDS_FILE}\n")
+    return batch_ids, None
+
+def preprocess_settings(args):
+    """Preprocess dict from --preprocess/--max-long-edge/--format/--quality, or None to send originals
+
+    Any of the specific options turns preprocessing on; unset ones keep the
+    DEFAULT_PREPROCESS values.
+    """
+    from encoding import DEFAULT_PREPROCESS
+
+    overrides = {'max_long_edge': args.max_long_edge, 'format': args.format, 'quality': args.quality}
+    overrides = {key: value for key, value in overrides.items() if value is not None}
+    if not args.preprocess and not overrides:
+        return None
+    return {**DEFAULT_PREPROCESS, **overrides}
+
+def open_request_source(args):
+    """Lazy request generator plus the manifest it checkpoints into"""
+    from encoding_cache import EncodingCache
+    from manifest import RunManifest
+    from mapping_store import MappingStore
+    from main import iter_batch_requests
+
+    manifest = RunManifest()
+    print(f"📋 Run manifest: {manifest.summary()}")
+    requests = iter_batch_requests(
+        args.image_folder, workers=args.workers, executor=args.executor, preprocess=preprocess_settings(args),
+        cache=None if args.no_cache else EncodingCache(),
+        manifest=manifest, mapping_file=None, mapping_store=MappingStore()
+    )
+    return requests, manifest
+
+def cmd_plan(args):
+    from manifest import RunManifest, DEFAULT_MANIFEST_FILE
+    from planner import plan_run, print_plan
+
+    manifest = RunManifest() if os.path.exists(DEFAULT_MANIFEST_FILE) else None
+    plan = plan_run(args.image_folder, preprocess=preprocess_settings(args),
+                    max_batch_bytes=int(args.max_batch_mb * 1024 * 1024), max_batch_requests=args.max_batch_requests,
+                    manifest=manifest, concurrency=args.concurrency, download_workers=args.download_workers)
+    print_plan(plan)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(plan, f, indent=2)
+        print(f"📁 Plan saved to {args.output}")
+    return 0
+
+def cmd_build(args):
+    from metrics import metrics
+
+    requests, _ = open_request_source(args)
+    count = 0
+    out = open(args.output, 'w') if args.output else None
+    try:
+        with metrics.stage('build'):
+            for request in requests:
+                if out is not None:
+                    out.write(json.dumps(request) + '\n')
+                count += 1
+    finally:
+        requests.close()
+        if out is not None:
+            out.close()
+    print(f"✅ Built {count} requests" + (f"; saved to {args.output}" if args.output else ""))
+    return 0
+
+def cmd_submit(args):
+    import asyncio
+    from main import submit_batch_chunks_async
+    from metrics import metrics
+
+    requests, manifest = open_request_source(args)
+    # Each batch is checkpointed in the manifest the moment it is created
+    with metrics.stage('submit'):
+        batch_ids, failed_chunks = asyncio.run(submit_batch_chunks_async(
+            requests, max_batch_bytes=int(args.max_batch_mb * 1024 * 1024),
+            max_batch_requests=args.max_batch_requests, max_concurrency=args.concurrency,
+            first_chunk_num=manifest.next_chunk_num(), on_submitted=manifest.record_batch))
+
+    if failed_chunks:
+        failed_count = sum(c['request_count'] for c in failed_chunks)
+        print(f"\n❌ {len(failed_chunks)} chunk(s) ({failed_count} requests) could not be submitted")
+        with open(FAILED_CHUNKS_FILE, "w") as f:
+            json.dump(failed_chunks, f, indent=2)
+        print(f"📁 Failed chunks saved to {FAILED_CHUNKS_FILE}")
+
+    # Save batch IDs (including batches from earlier runs) for tools that do not read the manifest
+    with open(BATCH_IDS_FILE, "w") as f:
+        json.dump(manifest.batch_ids(), f, indent=2)
+
+    if batch_ids:
+        print(f"\n✅ Submitted {len(batch_ids)} batch chunks (IDs saved to {BATCH_IDS_FILE})")
+        for batch_info in batch_ids:
+            print(f"  Chunk {batch_info['chunk_num']}: {batch_info['batch_id']}")
+        print("\nRun `python cli.py watch` to download results as batches finish")
+    elif not failed_chunks:
+        print("\n✅ Nothing new to submit; every image is already in a batch")
+    print(f"📋 Run manifest: {manifest.summary()}")
+    return 1 if failed_chunks else 0
+
+def cmd_sweep(args):
+    import asyncio
+    from encoding_cache import EncodingCache
+    from manifest import RunManifest
+    from mapping_store import MappingStore
+    from main import submit_batch_chunks_async
+    from sweep import load_variants, iter_sweep_requests
+    from metrics import metrics
+
+    variants = load_variants(args.variants)
+    manifest = RunManifest(args.manifest)
+    print(f"📋 Sweep manifest: {manifest.summary()}")
+    requests = iter_sweep_requests(
+        args.image_folder, variants, workers=args.workers, executor=args.executor, preprocess=preprocess_settings(args),
+        cache=None if args.no_cache else EncodingCache(), manifest=manifest, mapping_store=MappingStore())
+    with metrics.stage('submit'):
+        batch_ids, failed_chunks = asyncio.run(submit_batch_chunks_async(
+            requests, max_batch_bytes=int(args.max_batch_mb * 1024 * 1024),
+            max_batch_requests=args.max_batch_requests, max_concurrency=args.concurrency,
+            first_chunk_num=manifest.next_chunk_num(), on_submitted=manifest.record_batch))
+    if failed_chunks:
+        print(f"\n❌ {len(failed_chunks)} chunk(s) could not be submitted; run the sweep again to retry them")
+    print(f"📋 Sweep manifest: {manifest.summary()}")
+    print(f"\nRun `python cli.py watch --manifest {args.manifest} --output sweep_results.jsonl`, then "
+          f"`python cli.py evaluate --sweep`")
+    return 1 if failed_chunks else 0
+
+def cmd_retry(args):
+    from encoding_cache import EncodingCache
+    from retry import retry_failed
+    from metrics import metrics
+
+    with metrics.stage('retry'):
+        batch_ids, failed_chunks = retry_failed(
+            args.image_folder, args.results, args.mapping, max_attempts=args.max_attempts,
+            workers=args.workers, executor=args.executor, preprocess=preprocess_settings(args),
+            cache=None if args.no_cache else EncodingCache(), max_concurrency=args.concurrency,
+            dry_run=args.dry_run)
+    if batch_ids:
+        print("\nRun `python cli.py watch` to download the retried results")
+    return 1 if failed_chunks else 0
+
+def cmd_status(args):
+    from check_status import check_all_batches_status
+
+    batch_ids, _ = load_batch_ids(args.manifest)
+    return 0 if check_all_batches_status(batch_ids) else 1
+
+def open_results_store(args):
+    if not args.store:
+        return None
+    from results_store import ResultsStore
+    return ResultsStore(args.store)
+
+def cmd_watch(args):
+    import asyncio
+    from check_status import watch_batches
+    from metrics import metrics
+
+    batch_ids, manifest = load_batch_ids(args.manifest)
+    store = open_results_store(args)
+    try:
+        with metrics.stage('watch'):
+            ok = asyncio.run(watch_batches(batch_ids, args.output, download=not args.no_download,
+                                           min_interval=args.min_interval, max_interval=args.max_interval,
+                                           manifest=manifest, store=store))
+    finally:
+        if store is not None:
+            store.close()
+    return 0 if ok else 1
+
+def cmd_download(args):
+    from check_status import download_all_results
+    from metrics import metrics
+
+    batch_ids, manifest = load_batch_ids(args.manifest)
+    if manifest is not None:
+        # May mark batches for download again if the results file lost committed results
+        manifest.prepare_results_file(args.output)
+        if all(manifest.is_downloaded(b['batch_id']) for b in batch_ids):
+            print("✅ Every batch is already downloaded")
+            return 0
+    # Batches that have not ended yet are reported and skipped; run again later for the rest
+    store = open_results_store(args)
+    try:
+        with metrics.stage('download'):
+            ok = download_all_results(batch_ids, args.output, workers=args.workers, manifest=manifest, store=store)
+    finally:
+        if store is not None:
+            store.close()
+    return 0 if ok else 1
+
+def cmd_merge(args):
+    from results_store import ResultsStore
+    from metrics import metrics
+
+    with ResultsStore(args.store) as store, metrics.stage('merge'):
+        for results_file in args.results_files:
+            run_id = args.run_id or os.path.basename(results_file)
+            merged, improved = store.merge_jsonl(results_file, run_id=run_id)
+            print(f"📥 {results_file}: merged {merged} results as run {run_id!r} ({improved} now best for their custom_id)")
+        store.flush()
+        print(f"📁 Results store {args.store}: {len(store)} custom_ids")
+        if args.output:
+            count = store.write_jsonl(args.output)
+            print(f"📁 Wrote the best result for each of {count} custom_ids to {args.output}")
+    return 0
+
+def cmd_evaluate(args):
+    if args.sweep:
+        from sweep import evaluate_sweep, print_sweep_summary
+        print_sweep_summary(evaluate_sweep(args.results or "sweep_results.jsonl", args.mapping, workers=args.workers))
+        return 0
+
+    if args.incremental:
+        if args.export or args.cell_deg or args.bootstrap:
+            raise SystemExit("❌ --export, --cell-deg and --bootstrap need the full table; run without --incremental")
+        from incremental_eval import evaluate_incremental
+        evaluate_incremental(args.results or "geolocation_results.jsonl", args.mapping, args.state,
+                             workers=args.workers)
+        return 0
+
+    from evaluate import load_predictions, summarize, print_summary
+
+    table = load_predictions(args.results or "geolocation_results.jsonl", args.mapping, workers=args.workers)
+    print_summary(summarize(table['distance_km'], table['status']))
+    if args.bootstrap:
+        from bootstrap import bootstrap_summary, print_bootstrap_summary
+        print_bootstrap_summary(bootstrap_summary(table['distance_km'], args.bootstrap, args.confidence))
+    if args.cell_deg:
+        from spatial import cell_aggregates, print_cell_report
+        print_cell_report(cell_aggregates(table, args.cell_deg), args.cell_deg)
+    if args.export:
+        from export import export_table
+        export_table(table, args.export)
+        print(f"📁 Exported {len(table['custom_id'])} rows to {args.export}")
+    return 0
+
+def cmd_compare(args):
+    from bootstrap import compare_runs, print_comparison
+
+    if args.sweep:
+        from sweep import load_variant_tables
+        tables = load_variant_tables(args.results, args.mapping, workers=args.workers)
+        missing = [name for name in (args.baseline, args.candidate) if name not in tables]
+        if missing:
+            raise SystemExit(f"❌ No results for variant(s) {', '.join(missing)} in {args.results} "
+                             f"(found: {', '.join(tables) or 'none'})")
+        baseline, candidate = tables[args.baseline], tables[args.candidate]
+    else:
+        from evaluate import load_predictions
+        baseline = load_predictions(args.baseline, args.mapping, workers=args.workers)
+        candidate = load_predictions(args.candidate, args.mapping, workers=args.workers)
+
+    comparison = compare_runs(baseline, candidate, args.replicates, args.confidence, seed=args.seed)
+    print_comparison(comparison, args.baseline, args.candidate)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(comparison, f, indent=2)
+        print(f"📁 Comparison saved to {args.output}")
+    return 0
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Claude 4 batch geolocation pipeline")
+    parser.add_argument('--metrics-file', help="write stage metrics here (.json, or .prom for Prometheus)")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    def add_preprocess_options(sub):
+        sub.add_argument('--preprocess', action='store_true',
+                         help="resize and re-encode before upload (default 1568px, JPEG q85)")
+        sub.add_argument('--max-long-edge', type=int, help="preprocess: longest side in pixels (implies --preprocess)")
+        sub.add_argument('--format', choices=('jpeg', 'webp'), help="preprocess: output format (implies --preprocess)")
+        sub.add_argument('--quality', type=int, help="preprocess: encoder quality 1-100 (implies --preprocess)")
+
+    def add_image_options(sub):
+        sub.add_argument('image_folder')
+        sub.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="encoding workers")
+        sub.add_argument('--executor', choices=('thread', 'process'), default='thread')
+        add_preprocess_options(sub)
+        sub.add_argument('--no-cache', action='store_true', help="always re-encode instead of using the encoding cache")
+
+    sub = commands.add_parser('plan', help="dry run: predict payload size, batches and timings from file metadata")
+    sub.add_argument('image_folder')
+    add_preprocess_options(sub)  # Planning a preprocessed submit reads image headers
+    sub.add_argument('--concurrency', type=int, default=4, help="submissions in flight")
+    sub.add_argument('--max-batch-mb', type=float, default=240, help="payload MiB per batch")
+    sub.add_argument('--max-batch-requests', type=int, default=100_000)
+    sub.add_argument('--download-workers', type=int, default=4, help="parallel batch downloads")
+    sub.add_argument('--output', help="also save the plan as JSON")
+    sub.set_defaults(func=cmd_plan)
+
+    sub = commands.add_parser('build', help="encode images and build requests without submitting")
+    add_image_options(sub)
+    sub.add_argument('--output', help="also write the requests to this JSONL file")
+    sub.set_defaults(func=cmd_build)
+
+    sub = commands.add_parser('submit', help="build and submit batches")
+    add_image_options(sub)
+    sub.add_argument('--concurrency', type=int, default=4, help="submissions in flight")
+    sub.add_argument('--max-batch-mb', type=float, default=240, help="payload MiB per batch")
+    sub.add_argument('--max-batch-requests', type=int, default=100_000)
+    sub.set_defaults(func=cmd_submit, metrics_default="submit_metrics.json")
+
+    sub = commands.add_parser('sweep', help="submit every image under several model/prompt variants")
+    add_image_options(sub)
+    sub.add_argument('--variants', default="sweep_variants.json", help="JSON list of {name, model, prompt, max_tokens}")
+    sub.add_argument('--manifest', default="sweep_manifest.json")
+    sub.add_argument('--concurrency', type=int, default=4, help="submissions in flight")
+    sub.add_argument('--max-batch-mb', type=float, default=240, help="payload MiB per batch")
+    sub.add_argument('--max-batch-requests', type=int, default=100_000)
+    sub.set_defaults(func=cmd_sweep, metrics_default="sweep_metrics.json")
+
+    sub = commands.add_parser('retry', help="resubmit only errored or unparseable results")
+    add_image_options(sub)
+    sub.add_argument('--results', default="geolocation_results.jsonl")
+    sub.add_argument('--mapping', default="filename_mapping.json")
+    sub.add_argument('--max-attempts', type=int, default=3, help="submissions per image, counting the first")
+    sub.add_argument('--concurrency', type=int, default=4, help="submissions in flight")
+    sub.add_argument('--dry-run', action='store_true', help="only list failures in errors/")
+    sub.set_defaults(func=cmd_retry, metrics_default="retry_metrics.json")
+
+    sub = commands.add_parser('status', help="check batch status once (exit code 0 when all have ended)")
+    sub.add_argument('--manifest', help="run manifest to read (default run_manifest.json)")
+    sub.set_defaults(func=cmd_status)
+
+    sub = commands.add_parser('watch', help="poll until every batch ends, downloading each as it finishes")
+    sub.add_argument('--output', default="geolocation_results.jsonl")
+    sub.add_argument('--no-download', action='store_true')
+    sub.add_argument('--min-interval', type=float, default=10.0)
+    sub.add_argument('--max-interval', type=float, default=300.0)
+    sub.add_argument('--manifest', help="run manifest to read (default run_manifest.json)")
+    sub.add_argument('--store', nargs='?', const="geolocation_results_store",
+                     help="also merge each batch into this results store (default geolocation_results_store)")
+    sub.set_defaults(func=cmd_watch, metrics_default="download_metrics.json")
+
+    sub = commands.add_parser('download', help="download every batch that has ended")
+    sub.add_argument('--output', default="geolocation_results.jsonl")
+    sub.add_argument('--workers', type=int, default=4, help="parallel batch downloads")
+    sub.add_argument('--manifest', help="run manifest to read (default run_manifest.json)")
+    sub.add_argument('--store', nargs='?', const="geolocation_results_store",
+                     help="also merge each batch into this results store (default geolocation_results_store)")
+    sub.set_defaults(func=cmd_download, metrics_default="download_metrics.json")
+
+    sub = commands.add_parser('merge', help="merge results files into the results store (best result per custom_id)")
+    sub.add_argument('results_files', nargs='+')
+    sub.add_argument('--store', default="geolocation_results_store")
+    sub.add_argument('--run-id', help="run ID to record (default: each file's name)")
+    sub.add_argument('--output', help="also write the merged best results to this JSONL file")
+    sub.set_defaults(func=cmd_merge)
+
+    sub = commands.add_parser('evaluate', help="score results against ground-truth coordinates")
+    sub.add_argument('--results', help="results file (default geolocation_results.jsonl, or sweep_results.jsonl with --sweep)")
+    sub.add_argument('--mapping', default="filename_mapping.json")
+    sub.add_argument('--workers', type=int, help="parser processes (default: all CPUs)")
+    sub.add_argument('--export', help="also export the joined table (.parquet, .arrow, .npz or .csv)")
+    sub.add_argument('--sweep', action='store_true', help="score each variant of a sweep separately")
+    sub.add_argument('--cell-deg', type=float, help="also report error per grid cell of this many degrees")
+    sub.add_argument('--incremental', action='store_true',
+                     help="score only results appended since the last incremental run")
+    sub.add_argument('--state', default="eval_state.npz", help="state file for --incremental")
+    sub.add_argument('--bootstrap', type=int, metavar='REPLICATES',
+                     help="also report bootstrap confidence intervals from this many resamples")
+    sub.add_argument('--confidence', type=float, default=0.95)
+    sub.set_defaults(func=cmd_evaluate)
+
+    sub = commands.add_parser('compare', help="paired bootstrap comparison of two runs over the same images")
+    sub.add_argument('baseline', help="results file, or variant name with --sweep")
+    sub.add_argument('candidate', help="results file, or variant name with --sweep")
+    sub.add_argument('--sweep', action='store_true', help="compare two variants of one sweep results file")
+    sub.add_argument('--results', default="sweep_results.jsonl", help="sweep results file for --sweep")
+    sub.add_argument('--mapping', default="filename_mapping.json")
+    sub.add_argument('--workers', type=int, help="parser processes (default: all CPUs)")
+    sub.add_argument('--replicates', type=int, default=10_000)
+    sub.add_argument('--confidence', type=float, default=0.95)
+    sub.add_argument('--seed', type=int, default=0)
+    sub.add_argument('--output', help="also save the comparison as JSON")
+    sub.set_defaults(func=cmd_compare)
+
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        return args.func(args)
+    finally:
+        metrics_file = args.metrics_file or getattr(args, 'metrics_default', None)
+        if metrics_file:
+            from metrics import metrics
+            metrics.dump(metrics_file)
+
+if __name__ == "__main__":
+    sys.exit(main())
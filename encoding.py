@@ -0,0 +1,233 @@
+import os
+import base64
+import time
+from collections import deque
+from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow is only needed when preprocessing is enabled
+    Image = None
+
+# Claude downsizes anything with a long edge above ~1568px, so larger uploads only cost bandwidth
+DEFAULT_PREPROCESS = {'max_long_edge': 1568, 'format': 'jpeg', 'quality': 85}
+
+FORMAT_MEDIA_TYPES = {
+    'jpeg': "image/jpeg",
+    'png': "image/png",
+    'gif': "image/gif",
+    'webp': "image/webp",
+}
+
+def encode_image_to_base64(image_path):
+    """Convert image file to base64 string"""
+    with open(image_path, "rb") as image_file:
+        return base64.b64encode(image_file.read()).decode('utf-8')
+
+def get_image_media_type(file_path, image_format=None):
+    """Determine media type based on the re-encoded format if given, else the file extension"""
+    if image_format is not None:
+        return FORMAT_MEDIA_TYPES[image_format.lower()]
+    ext = os.path.splitext(file_path)[1].lower()
+    if ext in ['.jpg', '.jpeg']:
+        return "image/jpeg"
+    elif ext == '.png':
+        return "image/png"
+    elif ext == '.gif':
+        return "image/gif" 
+    elif ext == '.webp':
+        return "image/webp"
+    else:
+        return "image/jpeg"  # default
+
+def preprocess_image_bytes(raw, media_type, preprocess):
+    """Downscale to max_long_edge and re-encode as preprocess['format'] at preprocess['quality']
+
+    Returns (image_bytes, media_type). If re-encoding an image that needed no
+    resizing would make it bigger, the original bytes are kept.
+    """
+    if Image is None:
+        raise RuntimeError("Image preprocessing requires Pillow (pip install Pillow)")
+    
+    image_format = preprocess.get('format', 'jpeg').lower()
+    max_long_edge = preprocess.get('max_long_edge')
+    
+    with Image.open(BytesIO(raw)) as image:
+        image = ImageOps.exif_transpose(image)
+        resized = bool(max_long_edge) and max(image.size) > max_long_edge
+        if resized:
+            image.thumbnail((max_long_edge, max_long_edge), Image.LANCZOS)
+        if image_format == 'jpeg' and image.mode != 'RGB':
+            image = image.convert('RGB')
+        
+        out = BytesIO()
+        image.save(out, format=image_format.upper(), quality=preprocess.get('quality', 85))
+    
+    data = out.getvalue()
+    if not resized and len(data) >= len(raw):
+        return raw, media_type
+    return data, get_image_media_type(None, image_format)
+
+def encode_image_bytes(raw, image_path, preprocess=None):
+    """Optionally preprocess and encode image bytes already read from image_path
+
+    Returns (base64_image, media_type, bytes_read, payload_bytes), where
+    payload_bytes is the size of the image actually sent (after preprocessing).
+    """
+    media_type = get_image_media_type(image_path)
+    payload = raw
+    if preprocess:
+        payload, media_type = preprocess_image_bytes(raw, media_type, preprocess)
+    base64_image = base64.b64encode(payload).decode('utf-8')
+    return base64_image, media_type, len(raw), len(payload)
+
+def encode_image(image_path, preprocess=None):
+    """Read, optionally preprocess, and encode one image (see encode_image_bytes)"""
+    with open(image_path, "rb") as image_file:
+        raw = image_file.read()
+    return encode_image_bytes(raw, image_path, preprocess)
+
+class EncodeStats:
+    """Running throughput counters for the encoding stage
+
+    encode_seconds is the wall time during which at least one worker was
+    encoding, from start/end times taken on the workers themselves. It does
+    not grow while workers sit idle waiting for a slow consumer, and it does
+    not shrink when encoding overlaps with the consumer's own work.
+    """
+
+    def __init__(self):
+        self.images = 0
+        self.errors = 0
+        self.bytes_read = 0
+        self.bytes_payload = 0
+        self.bytes_encoded = 0
+        self.encode_seconds = 0.0
+        self.busy_until = None
+        self.started = time.perf_counter()
+
+    def add(self, bytes_read, bytes_payload, bytes_encoded):
+        self.images += 1
+        self.bytes_read += bytes_read
+        self.bytes_payload += bytes_payload
+        self.bytes_encoded += bytes_encoded
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def add_busy(self, start, end):
+        """Add one task's [start, end] to encode_seconds, counting overlap with earlier tasks once
+
+        Tasks start in submission order, so merging against the latest end seen
+        is enough to take the union of their intervals.
+        """
+        if self.busy_until is None or start >= self.busy_until:
+            self.encode_seconds += end - start
+        elif end > self.busy_until:
+            self.encode_seconds += end - self.busy_until
+        self.busy_until = end if self.busy_until is None else max(self.busy_until, end)
+
+    def summary(self):
+        elapsed = max(self.encode_seconds, 1e-9)
+        return {
+            'images': self.images,
+            'errors': self.errors,
+            'bytes_read': self.bytes_read,
+            'bytes_payload': self.bytes_payload,
+            'bytes_encoded': self.bytes_encoded,
+            'elapsed_sec': round(elapsed, 3),
+            'images_per_sec': round(self.images / elapsed, 2),
+            'read_mb_per_sec': round(self.bytes_read / elapsed / 1e6, 2),
+            'encoded_mb_per_sec': round(self.bytes_encoded / elapsed / 1e6, 2),
+        }
+
+    def report(self):
+        s = self.summary()
+        print(f"⚡ Encoded {s['images']} images in {s['elapsed_sec']}s "
+              f"({s['images_per_sec']} images/sec, {s['read_mb_per_sec']} MB/s read, "
+              f"{s['encoded_mb_per_sec']} MB/s encoded, {s['errors']} errors)")
+        if self.bytes_payload != self.bytes_read:
+            saved = 1 - self.bytes_payload / max(self.bytes_read, 1)
+            print(f"🗜️  Payload {self.bytes_read / 1e6:.1f} MB -> {self.bytes_payload / 1e6:.1f} MB "
+                  f"after preprocessing ({saved:.0%} smaller)")
+
+def timed_call(fn, *args):
+    """(fn(*args), start, end) timed where it runs; picklable for process pools
+
+    perf_counter is a system-wide monotonic clock, so times from pool
+    processes are comparable with each other.
+    """
+    started = time.perf_counter()
+    return fn(*args), started, time.perf_counter()
+
+def iter_encoded_images(image_paths, workers=1, executor="thread", max_pending=None, stats=None,
+                        preprocess=None, cache=None):
+    """Encode images on a worker pool, yielding (image_path, result, error) in input order
+
+    result is the tuple returned by encode_image(image_path, preprocess), or
+    None when error is set. At most max_pending encodings (default 4 per worker) are
+    in flight, so memory stays bounded even if the consumer is slow. Use
+    executor="process" when encoding is CPU-bound, "thread" when it is disk-bound.
+    With an encoding_cache.EncodingCache, unchanged images are loaded from the
+    cache instead of being read and encoded again.
+    """
+    if stats is None:
+        stats = EncodeStats()
+
+    def make_task(image_path):
+        if cache is None:
+            return encode_image, (image_path, preprocess)
+        return cache.task(image_path, preprocess)
+
+    def record(image_path, outcome, error):
+        if error is not None:
+            stats.errors += 1
+            return image_path, None, error
+        result = outcome if cache is None else cache.record(image_path, outcome)
+        stats.add(result[2], result[3], len(result[0]))
+        return image_path, result, None
+
+    if workers <= 1:
+        for image_path in image_paths:
+            started = time.perf_counter()
+            try:
+                fn, args = make_task(image_path)
+                outcome = fn(*args)
+            except Exception as e:
+                stats.add_busy(started, time.perf_counter())
+                yield record(image_path, None, e)
+                continue
+            stats.add_busy(started, time.perf_counter())
+            yield record(image_path, outcome, None)
+        return
+
+    if max_pending is None:
+        max_pending = workers * 4
+    pool_class = ProcessPoolExecutor if executor == "process" else ThreadPoolExecutor
+
+    with pool_class(max_workers=workers) as pool:
+        pending = deque()
+        paths = iter(image_paths)
+        exhausted = False
+        while True:
+            # Keep the window full so workers never idle while we wait on the head
+            while not exhausted and len(pending) < max_pending:
+                image_path = next(paths, None)
+                if image_path is None:
+                    exhausted = True
+                    break
+                fn, args = make_task(image_path)
+                pending.append((image_path, pool.submit(timed_call, fn, *args)))
+            if not pending:
+                return
+
+            # Always wait on the oldest future so output order matches input order
+            image_path, future = pending.popleft()
+            try:
+                outcome, started, ended = future.result()
+            except Exception as e:
+                yield record(image_path, None, e)
+                continue
+            stats.add_busy(started, ended)
+            yield record(image_path, outcome, None)
@@ -0,0 +1,181 @@
+import os
+import json
+import hashlib
+import tempfile
+
+from encoding import encode_image_bytes
+
+DEFAULT_CACHE_DIR = ".encoding_cache"
+DEFAULT_CACHE_MAX_BYTES = 5 * 1024**3  # 5GB of base64 payloads
+
+def hash_file_content(raw):
+    """Content hash used to address cached payloads"""
+    return hashlib.sha256(raw).hexdigest()
+
+def settings_key(preprocess):
+    """Stable string for the preprocessing settings a payload was produced with"""
+    if not preprocess:
+        return "raw"
+    return json.dumps(preprocess, sort_keys=True)
+
+def object_path(cache_dir, content_hash, preprocess):
+    """Path of the cached payload for this content + preprocessing settings"""
+    key = hashlib.sha256(f"{content_hash}:{settings_key(preprocess)}".encode()).hexdigest()[:40]
+    return os.path.join(cache_dir, "objects", key[:2], key)
+
+def read_object(path):
+    """Load a cached payload as (base64_image, media_type, bytes_read, payload_bytes)"""
+    with open(path, "rb") as f:
+        header, data = f.read().split(b"\n", 1)
+    meta = json.loads(header)
+    return data.decode('ascii'), meta['media_type'], meta['bytes_read'], meta['payload_bytes']
+
+def write_object(path, result):
+    """Atomically write a payload so concurrent workers never see a partial file"""
+    base64_image, media_type, bytes_read, payload_bytes = result
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    header = json.dumps({'media_type': media_type, 'bytes_read': bytes_read, 'payload_bytes': payload_bytes})
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    with os.fdopen(fd, "wb") as f:
+        f.write(header.encode() + b"\n" + base64_image.encode('ascii'))
+    os.replace(tmp_path, path)
+
+def load_or_encode(image_path, preprocess, cache_dir, content_hash=None):
+    """Worker task: return (result, content_hash, status) for one image
+
+    If the content hash is already known from file metadata, the cached payload is
+    read without touching the image. Otherwise the image is read and hashed; a
+    byte-identical image encoded earlier (under any filename) is reused, and only
+    genuinely new content is preprocessed, encoded and written to the cache.
+    """
+    if content_hash is not None:
+        path = object_path(cache_dir, content_hash, preprocess)
+        try:
+            result = read_object(path)
+            os.utime(path)  # Mark as recently used for eviction
+            return result, content_hash, 'hit'
+        except (OSError, ValueError, KeyError):
+            pass
+    
+    with open(image_path, "rb") as image_file:
+        raw = image_file.read()
+    content_hash = hash_file_content(raw)
+    path = object_path(cache_dir, content_hash, preprocess)
+    if os.path.exists(path):
+        try:
+            result = read_object(path)
+            os.utime(path)
+            return result, content_hash, 'duplicate'
+        except (OSError, ValueError, KeyError):
+            pass
+    
+    result = encode_image_bytes(raw, image_path, preprocess)
+    write_object(path, result)
+    return result, content_hash, 'miss'
+
+class EncodingCache:
+    """On-disk, content-addressed cache of encoded (and preprocessed) image payloads
+
+    Payloads are keyed by a SHA-256 of the image bytes plus the preprocessing
+    settings. A small stat index (path -> size, mtime, content hash) lets repeat
+    runs skip reading unchanged images entirely. Least-recently-used payloads are
+    evicted once the cache grows past max_bytes.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.index_file = os.path.join(cache_dir, "stat_index.json")
+        self.counts = {'hit': 0, 'duplicate': 0, 'miss': 0}
+        os.makedirs(cache_dir, exist_ok=True)
+        try:
+            with open(self.index_file, 'r') as f:
+                self.stat_index = json.load(f)
+        except (OSError, ValueError):
+            self.stat_index = {}
+
+    def known_hash(self, image_path):
+        """Content hash of image_path if its size and mtime are unchanged since it was hashed"""
+        entry = self.stat_index.get(os.path.abspath(image_path))
+        if entry is None:
+            return None
+        try:
+            st = os.stat(image_path)
+        except OSError:
+            return None
+        if entry[0] == st.st_size and entry[1] == st.st_mtime_ns:
+            return entry[2]
+        return None
+
+    def cached_size(self, image_path, preprocess):
+        """(payload_bytes, media_type) of a cached payload for image_path, or None; reads only its header line"""
+        content_hash = self.known_hash(image_path)
+        if content_hash is None:
+            return None
+        try:
+            with open(object_path(self.cache_dir, content_hash, preprocess), "rb") as f:
+                meta = json.loads(f.readline())
+        except (OSError, ValueError):
+            return None
+        return meta['payload_bytes'], meta['media_type']
+
+    def task(self, image_path, preprocess):
+        """(function, args) to run on a worker for this image"""
+        return load_or_encode, (image_path, preprocess, self.cache_dir, self.known_hash(image_path))
+
+    def record(self, image_path, outcome):
+        """Remember the content hash a worker reported and return the encoded result"""
+        result, content_hash, status = outcome
+        self.counts[status] += 1
+        try:
+            st = os.stat(image_path)
+            self.stat_index[os.path.abspath(image_path)] = [st.st_size, st.st_mtime_ns, content_hash]
+        except OSError:
+            pass
+        return result
+
+    def save_index(self):
+        """Persist the stat index atomically"""
+        tmp_path = self.index_file + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.stat_index, f)
+        os.replace(tmp_path, self.index_file)
+
+    def evict(self):
+        """Delete least-recently-used payloads until the cache fits in max_bytes"""
+        entries = []
+        total = 0
+        objects_dir = os.path.join(self.cache_dir, "objects")
+        if not os.path.isdir(objects_dir):
+            return 0, 0
+        for shard in os.scandir(objects_dir):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                st = entry.stat()
+                entries.append((st.st_mtime, st.st_size, entry.path))
+                total += st.st_size
+        
+        removed = 0
+        freed = 0
+        entries.sort()
+        for _, size, path in entries:
+            if total - freed <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            removed += 1
+            freed += size
+        return removed, freed
+
+    def close(self):
+        """Save the stat index, evict over-budget payloads and report hit rates"""
+        self.save_index()
+        removed, freed = self.evict()
+        c = self.counts
+        print(f"🗃️  Encoding cache: {c['hit']} hits, {c['duplicate']} duplicate images reused, "
+              f"{c['miss']} encoded")
+        if removed:
+            print(f"   Evicted {removed} cached payloads ({freed / 1e6:.1f} MB)")
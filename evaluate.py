@@ -0,0 +1,186 @@
+import re
+import numpy as np
+
+from mapping_store import load_filename_mapping, parse_ground_truth
+from metrics import metrics
+
+EARTH_RADIUS_KM = 6371.0
+
+# Standard geolocation accuracy thresholds: street, city, region, country, continent
+THRESHOLDS_KM = (1, 25, 200, 750, 2500)
+
+# Parse status codes (kept as small ints so they pack into numpy arrays)
+PARSE_OK = 0
+PARSE_NO_COORDINATES = 1
+PARSE_OUT_OF_RANGE = 2
+PARSE_API_ERROR = 3
+STATUS_NAMES = ('ok', 'no_coordinates', 'out_of_range', 'api_error')
+
+# Matches "Latitude: 12.3456 Longitude: -45.6789", tolerating markdown bold,
+# degree signs and N/S/E/W suffixes instead of a sign
+COORDINATE_PATTERN = re.compile(
+    r'Latitude\**\s*:?\**\s*([-+]?\d+(?:\.\d+)?)\s*°?\s*([NS])?\b.*?'
+    r'Longitude\**\s*:?\**\s*([-+]?\d+(?:\.\d+)?)\s*°?\s*([EW])?\b',
+    re.IGNORECASE | re.DOTALL
+)
+
+def extract_coordinates(text):
+    """Extract (lat, lon, status) from a model response
+
+    The answer is expected at the end of the response, so matching starts at the
+    last "Latitude" instead of scanning the reasoning text.
+    """
+    start = text.rfind('Latitude')
+    if start < 0:
+        start = text.lower().rfind('latitude')
+        if start < 0:
+            return np.nan, np.nan, PARSE_NO_COORDINATES
+    match = COORDINATE_PATTERN.match(text, start)
+    if match is None:
+        return np.nan, np.nan, PARSE_NO_COORDINATES
+
+    lat, lat_hemisphere, lon, lon_hemisphere = match.groups()
+    lat, lon = float(lat), float(lon)
+    if lat_hemisphere and lat_hemisphere.upper() == 'S':
+        lat = -abs(lat)
+    if lon_hemisphere and lon_hemisphere.upper() == 'W':
+        lon = -abs(lon)
+
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return lat, lon, PARSE_OUT_OF_RANGE
+    return lat, lon, PARSE_OK
+
+def response_text(result):
+    """Text of a result line from geolocation_results.jsonl, or None for API errors"""
+    body = result.get('result', {})
+    if body.get('type') != 'message':
+        return None
+    content_list = body.get('content', [])
+    return content_list[0].get('text', '') if content_list else ''
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Vectorized great-circle distance in km between arrays of coordinates (degrees)"""
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(a, dtype=np.float64)) for a in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+def latest_success_rows(custom_ids, status):
+    """Row to keep for each custom_id, in file order: its last successful row, else its last row
+
+    Retries append new lines for custom_ids that already have one, so a later
+    failure never hides an earlier success.
+    """
+    custom_ids = np.asarray(custom_ids).astype(str)
+    n = len(custom_ids)
+    if n == 0:
+        return np.arange(0)
+    ok = np.asarray(status) == PARSE_OK
+    # Sorted by custom_id, then success, then position: each group's last row is the keeper
+    order = np.lexsort((np.arange(n), ok, custom_ids))
+    sorted_ids = custom_ids[order]
+    last = np.ones(n, dtype=bool)
+    last[:-1] = sorted_ids[1:] != sorted_ids[:-1]
+    return np.sort(order[last])
+
+def load_predictions(results_file="geolocation_results.jsonl", mapping_file="filename_mapping.json", workers=None):
+    """Join results with ground truth into a dict of column arrays
+
+    Columns: custom_id, filename (object arrays), true_lat, true_lon, pred_lat,
+    pred_lon, distance_km (float64, nan where unavailable) and status (int8
+    parse status, see STATUS_NAMES). Large files are parsed on a process pool
+    (see sharded_parser). A custom_id with several results (from retries)
+    keeps one row, chosen by latest_success_rows.
+    """
+    from sharded_parser import parse_results_sharded  # Imports this module, so not at top level
+
+    with metrics.stage('parse'):
+        parsed = parse_results_sharded(results_file, workers=workers)
+    if parsed['bad_lines']:
+        print(f"Warning: skipped {parsed['bad_lines']} malformed lines in {results_file}")
+    metrics.count('parse_bad_lines', parsed['bad_lines'])
+    # One row per custom_id when retries appended answers for images seen before
+    keep = latest_success_rows(parsed['custom_id'], parsed['status'])
+    if len(keep) < len(parsed['custom_id']):
+        print(f"Merged {len(parsed['custom_id']) - len(keep)} superseded results from retries")
+        parsed = {name: parsed[name][keep] for name in ('custom_id', 'pred_lat', 'pred_lon', 'status')}
+    for code, count in enumerate(np.bincount(parsed['status'], minlength=len(STATUS_NAMES))):
+        metrics.count('results_parsed', int(count), status=STATUS_NAMES[code])
+
+    with load_filename_mapping(mapping_file) as filename_mapping:
+        return join_ground_truth(parsed['custom_id'].tolist(), parsed['pred_lat'], parsed['pred_lon'],
+                                 parsed['status'], filename_mapping)
+
+def join_ground_truth(custom_ids, pred_lat, pred_lon, status, filename_mapping):
+    """Attach filenames, true coordinates and distances to parsed prediction columns"""
+    filenames = [filename_mapping.get(custom_id, custom_id) for custom_id in custom_ids]
+    truth = [parse_ground_truth(filename) for filename in filenames]
+    true_lat = np.array([t[0] for t in truth], dtype=np.float64)
+    true_lon = np.array([t[1] for t in truth], dtype=np.float64)
+    pred_lat = np.asarray(pred_lat, dtype=np.float64)
+    pred_lon = np.asarray(pred_lon, dtype=np.float64)
+    status = np.asarray(status, dtype=np.int8)
+
+    # One vectorized pass; rows without a valid prediction stay nan
+    distance_km = haversine_km(true_lat, true_lon, pred_lat, pred_lon)
+    distance_km[status != PARSE_OK] = np.nan
+
+    return {
+        'custom_id': np.array(custom_ids, dtype=object),
+        'filename': np.array(filenames, dtype=object),
+        'true_lat': true_lat,
+        'true_lon': true_lon,
+        'pred_lat': pred_lat,
+        'pred_lon': pred_lon,
+        'distance_km': distance_km,
+        'status': status,
+    }
+
+def summarize(distance_km, status=None, thresholds=THRESHOLDS_KM):
+    """Median/mean error and accuracy at each threshold
+
+    Accuracy is the fraction of all evaluated images within the threshold, so
+    unparseable answers and API errors count as misses. Median and mean error
+    are over parsed predictions only.
+    """
+    distance_km = np.asarray(distance_km, dtype=np.float64)
+    valid = ~np.isnan(distance_km)
+    scored = distance_km[valid]
+    total = len(distance_km)
+
+    metrics = {
+        'total': int(total),
+        'parsed': int(valid.sum()),
+        'median_km': float(np.median(scored)) if len(scored) else None,
+        'mean_km': float(np.mean(scored)) if len(scored) else None,
+        'accuracy': {},
+    }
+    for threshold in thresholds:
+        hits = int(np.count_nonzero(scored <= threshold))
+        metrics['accuracy'][f'{threshold}km'] = hits / total if total else None
+    if status is not None:
+        counts = np.bincount(np.asarray(status, dtype=np.int64), minlength=len(STATUS_NAMES))
+        metrics['status_counts'] = {name: int(c) for name, c in zip(STATUS_NAMES, counts)}
+    return metrics
+
+def print_summary(metrics):
+    """Print a metrics dict from summarize in the project's report style"""
+    print(f"📊 Evaluated {metrics['total']} results ({metrics['parsed']} with parseable coordinates)")
+    if metrics['median_km'] is not None:
+        print(f"   Median error: {metrics['median_km']:.1f} km")
+        print(f"   Mean error:   {metrics['mean_km']:.1f} km")
+    for name, value in metrics['accuracy'].items():
+        if value is not None:
+            print(f"   Accuracy @ {name:>6}: {value:.2%}")
+    for name, count in metrics.get('status_counts', {}).items():
+        if count and name != 'ok':
+            print(f"   {name}: {count}")
+
+def evaluate(results_file="geolocation_results.jsonl", mapping_file="filename_mapping.json"):
+    """Load, score and report a results file; returns (table, metrics)"""
+    table = load_predictions(results_file, mapping_file)
+    metrics = summarize(table['distance_km'], table['status'])
+    print_summary(metrics)
+    return table, metrics
+
+if __name__ == "__main__":
+    evaluate()
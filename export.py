@@ -0,0 +1,108 @@
+import os
+import sys
+import csv
+import numpy as np
+
+from evaluate import load_predictions, STATUS_NAMES
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    import pyarrow.ipc as ipc
+except ImportError:  # pyarrow is only needed for the Parquet/Arrow formats
+    pa = None
+
+COLUMNS = ('custom_id', 'filename', 'true_lat', 'true_lon', 'pred_lat', 'pred_lon', 'distance_km', 'status')
+FLOAT_COLUMNS = ('true_lat', 'true_lon', 'pred_lat', 'pred_lon', 'distance_km')
+
+FORMATS = {
+    '.parquet': 'parquet',  # zstd-compressed, smallest on disk
+    '.arrow': 'arrow',      # uncompressed Arrow IPC, memory-mapped on load
+    '.feather': 'arrow',
+    '.npz': 'npz',          # compressed NumPy arrays, no pyarrow needed
+    '.csv': 'csv',          # for spreadsheets; slowest to load
+}
+
+def default_output():
+    return "claude4_benchmark_4k.parquet" if pa is not None else "claude4_benchmark_4k.npz"
+
+def to_arrow(table):
+    """Build a typed Arrow table: float64 coordinates, dictionary-encoded status"""
+    if pa is None:
+        raise RuntimeError("Parquet/Arrow export requires pyarrow (pip install pyarrow)")
+    arrays = {
+        'custom_id': pa.array(table['custom_id'].tolist(), type=pa.string()),
+        'filename': pa.array(table['filename'].tolist(), type=pa.string()),
+    }
+    for name in FLOAT_COLUMNS:
+        arrays[name] = pa.array(table[name], type=pa.float64())
+    arrays['status'] = pa.DictionaryArray.from_arrays(
+        pa.array(table['status'], type=pa.int8()), pa.array(STATUS_NAMES, type=pa.string()))
+    return pa.table(arrays)
+
+def export_table(table, output_file):
+    """Write a joined table (see evaluate.load_predictions) in the format implied by the extension"""
+    fmt = FORMATS.get(os.path.splitext(output_file)[1].lower())
+    if fmt is None:
+        raise ValueError(f"Unsupported export format for {output_file}; use one of {', '.join(FORMATS)}")
+
+    if fmt == 'parquet':
+        pq.write_table(to_arrow(table), output_file, compression='zstd')
+    elif fmt == 'arrow':
+        arrow_table = to_arrow(table)
+        with pa.OSFile(output_file, 'wb') as sink, ipc.new_file(sink, arrow_table.schema) as writer:
+            writer.write_table(arrow_table)
+    elif fmt == 'npz':
+        np.savez_compressed(
+            output_file,
+            custom_id=table['custom_id'].astype(str),
+            filename=table['filename'].astype(str),
+            status_names=np.array(STATUS_NAMES),
+            **{name: table[name] for name in FLOAT_COLUMNS + ('status',)}
+        )
+    else:
+        with open(output_file, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(COLUMNS)
+            for row in zip(*(table[name] for name in COLUMNS[:-1]), table['status']):
+                writer.writerow(list(row[:-1]) + [STATUS_NAMES[row[-1]]])
+
+def load_table(path):
+    """Load an exported table as a dict of column arrays
+
+    Arrow files are memory-mapped, so numeric columns are zero-copy views.
+    status is returned as int8 codes into evaluate.STATUS_NAMES.
+    """
+    fmt = FORMATS.get(os.path.splitext(path)[1].lower())
+    if fmt in ('parquet', 'arrow'):
+        if pa is None:
+            raise RuntimeError("Reading Parquet/Arrow requires pyarrow (pip install pyarrow)")
+        if fmt == 'parquet':
+            arrow_table = pq.read_table(path, memory_map=True)
+        else:
+            arrow_table = ipc.open_file(pa.memory_map(path, 'r')).read_all()
+        table = {name: arrow_table.column(name).to_numpy() for name in FLOAT_COLUMNS}
+        table['custom_id'] = arrow_table.column('custom_id').to_numpy()
+        table['filename'] = arrow_table.column('filename').to_numpy()
+        # Map through the stored dictionary in case its order differs from STATUS_NAMES
+        status = arrow_table.column('status').combine_chunks()
+        lookup = np.array([STATUS_NAMES.index(name) for name in status.dictionary.to_pylist()], dtype=np.int8)
+        table['status'] = lookup[status.indices.to_numpy()]
+        return table
+    if fmt == 'npz':
+        with np.load(path) as data:
+            return {name: data[name] for name in COLUMNS}
+    raise ValueError(f"Unsupported table format for {path}")
+
+def export_results(results_file="geolocation_results.jsonl", mapping_file="filename_mapping.json",
+                   output_file=None):
+    """Parse, join with ground truth and export in one step"""
+    output_file = output_file or default_output()
+    table = load_predictions(results_file, mapping_file)
+    export_table(table, output_file)
+    print(f"📁 Exported {len(table['custom_id'])} rows to {output_file} ({os.path.getsize(output_file) / 1e6:.2f} MB)")
+    return output_file
+
+if __name__ == "__main__":
+    # Usage: python export.py [output_file]  (.parquet, .arrow, .npz or .csv)
+    export_results(output_file=sys.argv[1] if len(sys.argv) > 1 else None)
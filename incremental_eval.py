@@ -0,0 +1,219 @@
+import io
+import os
+import json
+import hashlib
+import numpy as np
+
+from evaluate import join_ground_truth, latest_success_rows, print_summary, THRESHOLDS_KM, STATUS_NAMES, PARSE_OK
+from mapping_store import load_filename_mapping
+from metrics import metrics
+
+DEFAULT_EVAL_STATE = "eval_state.npz"
+STATE_VERSION = 1
+
+# Error-distribution sketch: 0 km, then 160 log-spaced edges from 100 m to half
+# the Earth's circumference (~6% wide bins), so the state stays a fixed size
+HISTOGRAM_EDGES_KM = np.concatenate([[0.0], np.logspace(-1, np.log10(20037.5), 160)])
+
+FINGERPRINT_BYTES = 4096  # Bytes before the saved offset that must be unchanged to resume
+
+def fingerprint(results_file, offset):
+    """Hash of the bytes just before offset; a mismatch means the file was rewritten"""
+    with open(results_file, 'rb') as f:
+        f.seek(max(0, offset - FINGERPRINT_BYTES))
+        return hashlib.sha256(f.read(min(offset, FINGERPRINT_BYTES))).hexdigest()
+
+def complete_lines_end(results_file):
+    """Offset just past the last newline, so a line still being written is left for next time"""
+    size = os.path.getsize(results_file)
+    with open(results_file, 'rb') as f:
+        position = size
+        while position > 0:
+            step = min(64 * 1024, position)
+            f.seek(position - step)
+            block = f.read(step)
+            newline = block.rfind(b'\n')
+            if newline != -1:
+                return position - step + newline + 1
+            position -= step
+    return 0
+
+def histogram_bins(distance_km):
+    return np.clip(np.searchsorted(HISTOGRAM_EDGES_KM, distance_km, side='right') - 1,
+                   0, len(HISTOGRAM_EDGES_KM) - 1)
+
+class IncrementalEvaluator:
+    """Score a growing results file, parsing only the lines added since the last run
+
+    The state file keeps the byte offset already scored, plus the latest status
+    and distance per custom_id and the running aggregates: status counts,
+    threshold hits, distance sum and a log-binned error histogram. New lines are
+    parsed (on a process pool when large, see sharded_parser) and folded into
+    the aggregates. When a custom_id shows up again, e.g. from a retry, the old
+    contribution is subtracted first. The newer result wins, except that a
+    failure never replaces a successful result (see
+    evaluate.latest_success_rows). If the file was
+    truncated or rewritten, everything is re-scored from the start.
+    """
+
+    def __init__(self, results_file="geolocation_results.jsonl", mapping_file="filename_mapping.json",
+                 state_file=DEFAULT_EVAL_STATE, thresholds=THRESHOLDS_KM):
+        self.results_file = results_file
+        self.mapping_file = mapping_file
+        self.state_file = state_file
+        self.thresholds = tuple(thresholds)
+        self.reset()
+        if os.path.exists(state_file):
+            self.load()
+
+    def reset(self):
+        self.offset = 0
+        self.fingerprint = None
+        self.custom_ids = np.array([], dtype=object)
+        self.status = np.array([], dtype=np.int8)
+        self.distance_km = np.array([], dtype=np.float64)
+        self.index = {}
+        self.status_counts = np.zeros(len(STATUS_NAMES), dtype=np.int64)
+        self.threshold_hits = np.zeros(len(self.thresholds), dtype=np.int64)
+        self.distance_sum = 0.0
+        self.histogram = np.zeros(len(HISTOGRAM_EDGES_KM), dtype=np.int64)
+
+    # Persistence
+
+    def load(self):
+        with np.load(self.state_file, allow_pickle=False) as data:
+            meta = json.loads(str(data['meta']))
+            if (meta.get('version') != STATE_VERSION or meta['results_file'] != os.path.abspath(self.results_file)
+                    or tuple(meta['thresholds']) != self.thresholds):
+                print(f"⚠️  {self.state_file} was built for different settings; re-scoring from scratch")
+                return
+            self.offset = meta['offset']
+            self.fingerprint = meta['fingerprint']
+            self.distance_sum = meta['distance_sum']
+            self.custom_ids = data['custom_ids'].astype(object)
+            self.status = data['status']
+            self.distance_km = data['distance_km']
+            self.status_counts = data['status_counts']
+            self.threshold_hits = data['threshold_hits']
+            self.histogram = data['histogram']
+        self.index = {custom_id: i for i, custom_id in enumerate(self.custom_ids)}
+
+    def save(self):
+        meta = {
+            'version': STATE_VERSION,
+            'results_file': os.path.abspath(self.results_file),
+            'thresholds': list(self.thresholds),
+            'offset': self.offset,
+            'fingerprint': self.fingerprint,
+            'distance_sum': self.distance_sum,
+        }
+        buffer = io.BytesIO()
+        np.savez(buffer, meta=np.array(json.dumps(meta)), custom_ids=self.custom_ids.astype(str),
+                 status=self.status, distance_km=self.distance_km, status_counts=self.status_counts,
+                 threshold_hits=self.threshold_hits, histogram=self.histogram)
+        tmp_path = self.state_file + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(buffer.getvalue())
+        os.replace(tmp_path, self.state_file)
+
+    # Scoring
+
+    def _apply(self, status, distance_km, sign):
+        """Add (sign=1) or remove (sign=-1) rows from the running aggregates"""
+        self.status_counts += sign * np.bincount(status.astype(np.int64), minlength=len(STATUS_NAMES))
+        scored = distance_km[status == PARSE_OK]
+        self.threshold_hits += sign * np.array([np.count_nonzero(scored <= t) for t in self.thresholds],
+                                               dtype=np.int64)
+        self.distance_sum += sign * float(scored.sum())
+        np.add.at(self.histogram, histogram_bins(scored), sign)
+
+    def update(self, workers=None):
+        """Score lines appended since the last update; returns the number of new lines scored"""
+        from sharded_parser import parse_results_sharded
+
+        end = complete_lines_end(self.results_file)
+        if self.offset and (end < self.offset or fingerprint(self.results_file, self.offset) != self.fingerprint):
+            print(f"⚠️  {self.results_file} changed before the last scored offset; re-scoring from scratch")
+            self.reset()
+        if end == self.offset:
+            return 0
+
+        with metrics.stage('incremental_parse'):
+            parsed = parse_results_sharded(self.results_file, workers=workers, start=self.offset, end=end)
+        if parsed['bad_lines']:
+            print(f"Warning: skipped {parsed['bad_lines']} malformed lines in {self.results_file}")
+        new_rows = len(parsed['custom_id'])
+
+        if new_rows:
+            with load_filename_mapping(self.mapping_file) as filename_mapping:
+                table = join_ground_truth(parsed['custom_id'].tolist(), parsed['pred_lat'], parsed['pred_lon'],
+                                          parsed['status'], filename_mapping)
+            self._merge(table['custom_id'], table['status'], table['distance_km'])
+
+        self.offset = end
+        self.fingerprint = fingerprint(self.results_file, end)
+        metrics.count('incremental_rows_scored', new_rows)
+        return new_rows
+
+    def _merge(self, custom_ids, status, distance_km):
+        # Within the new lines, one row per custom_id by the same rule as a full evaluation
+        keep = latest_success_rows(custom_ids, status)
+        custom_ids, status, distance_km = custom_ids[keep], status[keep], distance_km[keep]
+
+        positions = np.array([self.index.get(custom_id, -1) for custom_id in custom_ids], dtype=np.int64)
+        existing = positions >= 0
+        # A failure never replaces a result that was already scored successfully
+        existing_positions = positions[existing]
+        ignore = np.zeros(len(custom_ids), dtype=bool)
+        ignore[existing] = (status[existing] != PARSE_OK) & (self.status[existing_positions] == PARSE_OK)
+        replace = existing & ~ignore
+        added = ~existing
+
+        replaced_positions = positions[replace]
+        self._apply(self.status[replaced_positions], self.distance_km[replaced_positions], -1)
+        self.status[replaced_positions] = status[replace]
+        self.distance_km[replaced_positions] = distance_km[replace]
+        self._apply(status[replace], distance_km[replace], 1)
+
+        first_new = len(self.custom_ids)
+        self.custom_ids = np.concatenate([self.custom_ids, custom_ids[added]])
+        self.status = np.concatenate([self.status, status[added]])
+        self.distance_km = np.concatenate([self.distance_km, distance_km[added]])
+        for i, custom_id in enumerate(custom_ids[added], first_new):
+            self.index[custom_id] = i
+        self._apply(status[added], distance_km[added], 1)
+
+    # Reporting
+
+    def summary(self):
+        """Metrics in the same shape as evaluate.summarize, from the running aggregates"""
+        total = int(len(self.custom_ids))
+        parsed = int(self.status_counts[PARSE_OK])
+        scored = self.distance_km[self.status == PARSE_OK]
+        return {
+            'total': total,
+            'parsed': parsed,
+            'median_km': float(np.median(scored)) if parsed else None,
+            'mean_km': self.distance_sum / parsed if parsed else None,
+            'accuracy': {f'{t}km': int(hits) / total if total else None
+                         for t, hits in zip(self.thresholds, self.threshold_hits)},
+            'status_counts': {name: int(c) for name, c in zip(STATUS_NAMES, self.status_counts)},
+        }
+
+    def histogram_table(self):
+        """(lower edge km, count) for every non-empty error bin"""
+        return [(float(HISTOGRAM_EDGES_KM[i]), int(c)) for i, c in enumerate(self.histogram) if c]
+
+def evaluate_incremental(results_file="geolocation_results.jsonl", mapping_file="filename_mapping.json",
+                         state_file=DEFAULT_EVAL_STATE, workers=None):
+    """Score only what was appended since the last call, then report the overall metrics"""
+    evaluator = IncrementalEvaluator(results_file, mapping_file, state_file)
+    new_rows = evaluator.update(workers=workers)
+    evaluator.save()
+    print(f"⚡ Scored {new_rows} new results (scored through byte {evaluator.offset:,})")
+    summary = evaluator.summary()
+    print_summary(summary)
+    return summary
+
+if __name__ == "__main__":
+    evaluate_incremental()
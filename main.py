@@ -1,31 +1,12 @@
 import os
 import json
-import base64
 import hashlib
-from anthropic import Anthropic
+import random
+import asyncio
 import time
-
-# Initialize the Anthropic client
-client = Anthropic(api_key="your-api-key-here")
-
-def encode_image_to_base64(image_path):
-    """Convert image file to base64 string"""
-    with open(image_path, "rb") as image_file:
-        return base64.b64encode(image_file.read()).decode('utf-8')
-
-def get_image_media_type(file_path):
-    """Determine media type based on file extension"""
-    ext = os.path.splitext(file_path)[1].lower()
-    if ext in ['.jpg', '.jpeg']:
-        return "image/jpeg"
-    elif ext == '.png':
-        return "image/png"
-    elif ext == '.gif':
-        return "image/gif" 
-    elif ext == '.webp':
-        return "image/webp"
-    else:
-        return "image/jpeg"  # default
+from api_client import get_client, get_async_client
+from encoding import iter_encoded_images, EncodeStats
+from metrics import metrics
 
 def create_short_custom_id(filename, index):
     """Create a short custom_id that stays under 64 characters"""
@@ -39,307 +20,396 @@ def create_short_custom_id(filename, index):
     
     return custom_id
 
-def create_batch_requests(image_folder_path):
-    """Create batch requests for all images in folder"""
-    requests = []
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.webp'}
+
+def list_image_files(image_folder_path):
+    """List image files in folder, sorted so custom_id assignment is stable across runs"""
+    return sorted(f for f in os.listdir(image_folder_path)
+                  if os.path.splitext(f)[1].lower() in IMAGE_EXTENSIONS)
+
+# Defaults for every request; sweep.py varies them per variant
+DEFAULT_MODEL = "claude-sonnet-4-20250514"
+DEFAULT_MAX_TOKENS = 500
+GEOLOCATION_PROMPT = "You are a geolocation AI trained to estimate the latitude and longitude of any image based on visual features alone — such as architecture, vegetation, signage, weather, and landforms. Even without GPS or metadata, you must always provide your best guess. Please return the result in only this format with 4 decimal places: Latitude: <decimal> Longitude: <decimal>"
+
+def build_request(custom_id, base64_image, media_type, model=DEFAULT_MODEL, max_tokens=DEFAULT_MAX_TOKENS,
+                  prompt=GEOLOCATION_PROMPT):
+    """Build a single batch request for one encoded image"""
+    return {
+        "custom_id": custom_id,  # Now guaranteed to be under 64 chars
+        "params": {
+            "model": model,
+            "max_tokens": max_tokens,
+            "messages": [
+                {
+                    "role": "user",
+                    "content": [
+                        {
+                            "type": "image",
+                            "source": {
+                                "type": "base64",
+                                "media_type": media_type,
+                                "data": base64_image
+                            }
+                        },
+                        {
+                            "type": "text",
+                            "text": prompt
+                        }
+                    ]
+                }
+            ]
+        }
+    }
+
+def iter_batch_requests(image_folder_path, mapping_file="filename_mapping.json",
+                        workers=1, executor="thread", preprocess=None, cache=None, manifest=None,
+                        mapping_store=None):
+    """Lazily yield batch requests for all images in folder
+
+    Only the requests currently being consumed hold base64 payloads, so memory
+    stays bounded by whatever the consumer buffers (one chunk when fed to
+    submit_batch_chunks). With workers > 1 images are encoded on a thread or
+    process pool; output order and custom_ids are the same as a serial run.
+    preprocess (e.g. encoding.DEFAULT_PREPROCESS) downscales and re-encodes each
+    image before base64 to shrink the payload. With an EncodingCache, images
+    whose content was already encoded with the same settings are loaded from
+    the cache instead of being re-read and re-encoded.
+    With a RunManifest, images keep the custom_id from earlier runs and images
+    that were already submitted are skipped without being read; the preprocess
+    settings are recorded there so retries can encode the same way.
+    The filename mapping JSON (if mapping_file is set) is written once the
+    generator is exhausted or closed. A MappingStore instead gets each new
+    custom_id appended as soon as its image is encoded, with its content hash
+    when a cache is in use.
+    """
     filename_mapping = {}  # To track custom_id to filename mapping
     
     # Get all image files from the folder
-    image_extensions = {'.jpg', '.jpeg', '.png', '.gif', '.webp'}
-    image_files = [f for f in os.listdir(image_folder_path) 
-                   if os.path.splitext(f)[1].lower() in image_extensions]
-    
-    print(f"Found {len(image_files)} images to process")
+    image_files = list_image_files(image_folder_path)
     
+    # Assign custom_ids up front so already-submitted images can be skipped before encoding
+    # custom_id index is the position in the sorted file list, independent of worker timing
+    todo = []
     for i, filename in enumerate(image_files):
-        image_path = os.path.join(image_folder_path, filename)
-        
-        try:
-            # Encode image
-            base64_image = encode_image_to_base64(image_path)
-            media_type = get_image_media_type(image_path)
-            
-            # Create short custom_id
+        custom_id = manifest.custom_id_for(filename) if manifest is not None else None
+        if custom_id is None:
             custom_id = create_short_custom_id(filename, i)
+        
+        # Store mapping for later reference
+        filename_mapping[custom_id] = filename
+        
+        if manifest is not None:
+            manifest.add_image(custom_id, filename)
+            if manifest.image_state(custom_id) != 'pending':
+                continue
+        todo.append((custom_id, filename))
+    
+    if len(todo) < len(image_files):
+        print(f"Found {len(image_files)} images, {len(image_files) - len(todo)} already submitted; "
+              f"{len(todo)} left to process (encoding with {workers} {executor} worker(s))")
+    else:
+        print(f"Found {len(image_files)} images to process (encoding with {workers} {executor} worker(s))")
+    
+    if manifest is not None and todo:
+        manifest.record_preprocess(preprocess)
+    
+    stats = EncodeStats()
+    image_paths = [os.path.join(image_folder_path, filename) for _, filename in todo]
+    encoded = iter_encoded_images(image_paths, workers=workers, executor=executor, stats=stats,
+                                  preprocess=preprocess, cache=cache)
+    
+    try:
+        for (custom_id, filename), (image_path, result, error) in zip(todo, encoded):
+            if error is not None:
+                print(f"Error processing {filename}: {error}")
+                continue
             
-            # Store mapping for later reference
-            filename_mapping[custom_id] = filename
-            
-            # Create the request
-            request = {
-                "custom_id": custom_id,  # Now guaranteed to be under 64 chars
-                "params": {
-                    "model": "claude-sonnet-4-20250514",
-                    "max_tokens": 500,
-                    "messages": [
-                        {
-                            "role": "user",
-                            "content": [
-                                {
-                                    "type": "image",
-                                    "source": {
-                                        "type": "base64",
-                                        "media_type": media_type,
-                                        "data": base64_image
-                                    }
-                                },
-                                {
-                                    "type": "text",
-                                    "text": "You are a geolocation AI trained to estimate the latitude and longitude of any image based on visual features alone — such as architecture, vegetation, signage, weather, and landforms. Even without GPS or metadata, you must always provide your best guess. Please return the result in only this format with 4 decimal places: Latitude: <decimal> Longitude: <decimal>"
-                                }
-                            ]
-                        }
-                    ]
-                }
-            }
+            base64_image, media_type = result[0], result[1]
             
-            requests.append(request)
+            if mapping_store is not None:
+                content_hash = cache.known_hash(image_path) if cache is not None else None
+                entry = mapping_store.lookup(custom_id)
+                if entry is None or (content_hash and entry.content_hash != content_hash):
+                    mapping_store.put(custom_id, filename, content_hash)
             
-        except Exception as e:
-            print(f"Error processing {filename}: {e}")
+            yield build_request(custom_id, base64_image, media_type)
+    finally:
+        encoded.close()
+        stats.report()
+        # Encode-only time from the encoder itself; this generator's lifetime also covers packing and uploads
+        metrics.observe('stage', stats.encode_seconds, stage='encode')
+        metrics.count('images_encoded', stats.images)
+        metrics.count('encode_errors', stats.errors)
+        metrics.count('bytes_read', stats.bytes_read)
+        metrics.count('bytes_encoded', stats.bytes_encoded)
+        metrics.count('images_skipped', len(image_files) - len(todo))
+        if cache is not None:
+            cache.close()
+        if manifest is not None:
+            manifest.save()
+        if mapping_store is not None:
+            mapping_store.flush()
+            print(f"📁 Filename mapping store updated ({len(mapping_store)} entries)")
+        
+        # Save filename mapping for later use
+        if mapping_file is not None:
+            with open(mapping_file, "w") as f:
+                json.dump(filename_mapping, f, indent=2)
+            print(f"📁 Filename mapping saved to {mapping_file}")
+
+def create_batch_requests(image_folder_path):
+    """Create batch requests for all images in folder
+
+    Materializes every request in memory; prefer iter_batch_requests for large folders.
+    """
+    return list(iter_batch_requests(image_folder_path))
+
+# Batch API ceilings: 256MB and 100,000 requests per batch. Leave headroom for
+# the SDK's request envelope so a full batch never trips the size limit.
+MAX_BATCH_BYTES = 240 * 1024 * 1024
+MAX_BATCH_REQUESTS = 100_000
+
+def request_size(request):
+    """Serialized JSON size of a request in bytes
+
+    Base64 needs no JSON escaping, so the payload is counted by length instead of
+    serializing the multi-megabyte string a second time.
+    """
+    source = request['params']['messages'][0]['content'][0]['source']
+    data = source['data']
+    source['data'] = ""
+    try:
+        envelope = len(json.dumps(request).encode('utf-8'))
+    finally:
+        source['data'] = data
+    return envelope + len(data)
+
+def iter_packed_chunks(requests, max_batch_bytes=MAX_BATCH_BYTES, max_batch_requests=MAX_BATCH_REQUESTS):
+    """Greedily pack requests into chunks that fit both the byte and request-count ceilings
+
+    Yields (chunk, chunk_bytes) one chunk at a time from any iterable. A request
+    that is larger than max_batch_bytes on its own can never be submitted, so it
+    is reported and skipped.
+    """
+    chunk = []
+    chunk_bytes = 0
+    # Each request is followed by a comma in the JSON array
+    for request in requests:
+        size = request_size(request) + 1
+        if size > max_batch_bytes:
+            print(f"❌ Skipping {request['custom_id']}: {size / 1e6:.1f} MB exceeds the {max_batch_bytes / 1e6:.1f} MB batch limit")
             continue
-    
-    # Save filename mapping for later use
-    with open("filename_mapping.json", "w") as f:
-        json.dump(filename_mapping, f, indent=2)
-    print(f"📁 Filename mapping saved to filename_mapping.json")
-    
-    return requests
+        if chunk and (chunk_bytes + size > max_batch_bytes or len(chunk) >= max_batch_requests):
+            yield chunk, chunk_bytes
+            chunk = []
+            chunk_bytes = 0
+        chunk.append(request)
+        chunk_bytes += size
+    if chunk:
+        yield chunk, chunk_bytes
+
+def submit_batch_chunks(requests, max_batch_bytes=MAX_BATCH_BYTES, max_batch_requests=MAX_BATCH_REQUESTS,
+                        first_chunk_num=1, on_submitted=None):
+    """Submit requests in chunks packed up to the 256MB / request-count limits
 
-def submit_batch_chunks(requests, chunk_size=50):
-    """Submit requests in smaller chunks to avoid 256MB limit"""
+    Accepts a list or a lazy iterable such as iter_batch_requests; only one
+    chunk of requests is held at a time. on_submitted(batch_info) is called right
+    after each batch is created, e.g. RunManifest.record_batch to checkpoint it.
+    """
     batch_ids = []
-    total_requests = len(requests)
     
-    print(f"Splitting {total_requests} requests into chunks of {chunk_size}")
+    print(f"Packing requests into batches of at most {max_batch_bytes / 1e6:.1f} MB / {max_batch_requests} requests")
     
-    for i in range(0, total_requests, chunk_size):
-        chunk = requests[i:i + chunk_size]
-        chunk_num = (i // chunk_size) + 1
-        total_chunks = (total_requests + chunk_size - 1) // chunk_size
-        
-        print(f"\nSubmitting chunk {chunk_num}/{total_chunks} ({len(chunk)} requests)...")
+    start_index = 0
+    for chunk_num, (chunk, chunk_bytes) in enumerate(iter_packed_chunks(requests, max_batch_bytes, max_batch_requests),
+                                                     first_chunk_num):
+        print(f"\nSubmitting chunk {chunk_num} ({len(chunk)} requests, {chunk_bytes / 1e6:.1f} MB)...")
         
         # Debug: Check custom_id lengths in this chunk
         max_id_length = max(len(req['custom_id']) for req in chunk)
         print(f"   Max custom_id length in chunk: {max_id_length}")
+        if max_id_length > 64:
+            print("❌ Warning: Some custom_ids in this chunk are too long!")
         
         try:
             # Create the batch
-            batch = client.beta.messages.batches.create(
-                requests=chunk
-            )
+            with metrics.timer('submit_request'):
+                batch = get_client().beta.messages.batches.create(
+                    requests=chunk
+                )
+            record_submitted(batch.id, chunk_num, len(chunk), chunk_bytes)
             
             print(f"✅ Chunk {chunk_num} submitted successfully!")
             print(f"   Batch ID: {batch.id}")
             print(f"   Status: {batch.processing_status}")
             
-            batch_ids.append({
+            batch_info = {
                 'batch_id': batch.id,
                 'chunk_num': chunk_num,
                 'request_count': len(chunk),
-                'start_index': i,
-                'end_index': i + len(chunk) - 1
-            })
+                'payload_bytes': chunk_bytes,
+                'start_index': start_index,
+                'end_index': start_index + len(chunk) - 1,
+                'custom_ids': [req['custom_id'] for req in chunk]
+            }
+            batch_ids.append(batch_info)
+            if on_submitted is not None:
+                on_submitted(batch_info)
             
             # Small delay between submissions
             time.sleep(1)
             
         except Exception as e:
             print(f"❌ Error creating chunk {chunk_num}: {e}")
-            continue
+            metrics.count('submit_failures')
+        
+        start_index += len(chunk)
+    
+    if start_index == 0:
+        print("No requests to submit.")
     
     return batch_ids
 
-def submit_batch(requests, batch_name="geolocation_batch"):
-    """Legacy function - now redirects to chunked submission"""
-    return submit_batch_chunks(requests)
+def record_submitted(batch_id, chunk_num, request_count, payload_bytes):
+    """Count a created batch and timestamp it for per-batch submit-to-end latency"""
+    metrics.count('batches_submitted')
+    metrics.count('requests_submitted', request_count)
+    metrics.count('bytes_uploaded', payload_bytes)
+    metrics.event('batch_submitted', batch_id=batch_id, chunk_num=chunk_num,
+                  request_count=request_count, payload_bytes=payload_bytes)
 
-def check_all_batches_status(batch_ids):
-    """Check status of all batch chunks"""
-    print("Checking status of all batches...\n")
-    
-    total_succeeded = 0
-    total_failed = 0
-    total_processing = 0
-    all_ended = True
-    
-    for batch_info in batch_ids:
-        batch_id = batch_info['batch_id']
-        chunk_num = batch_info['chunk_num']
-        
-        try:
-            batch = client.beta.messages.batches.retrieve(batch_id)
-            print(f"Chunk {chunk_num} (ID: {batch_id[:12]}...):")
-            print(f"  Status: {batch.processing_status}")
-            
-            if hasattr(batch, 'request_counts'):
-                counts = batch.request_counts
-                succeeded = counts.get('succeeded', 0)
-                failed = counts.get('failed', 0)
-                processing = counts.get('processing', 0)
-                
-                print(f"  Succeeded: {succeeded}")
-                print(f"  Failed: {failed}")
-                print(f"  Processing: {processing}")
-                
-                total_succeeded += succeeded
-                total_failed += failed
-                total_processing += processing
-            
-            if batch.processing_status != "ended":
-                all_ended = False
-                
-            print()
-            
-        except Exception as e:
-            print(f"Error checking batch {batch_id}: {e}")
-            all_ended = False
-    
-    print(f"TOTALS:")
-    print(f"  Succeeded: {total_succeeded}")
-    print(f"  Failed: {total_failed}")
-    print(f"  Still processing: {total_processing}")
-    print(f"  All batches complete: {'Yes' if all_ended else 'No'}")
-    
-    return all_ended
+# Status codes worth retrying: timeouts, conflicts, rate limits and any 5xx/529 overload
+RETRYABLE_STATUS_CODES = {408, 409, 429}
 
-def download_all_results(batch_ids, output_file="geolocation_results.jsonl"):
-    """Download results from all batch chunks"""
-    all_results = []
-    
-    print("Downloading results from all batches...\n")
-    
-    for batch_info in batch_ids:
-        batch_id = batch_info['batch_id']
-        chunk_num = batch_info['chunk_num']
-        
-        try:
-            batch = client.beta.messages.batches.retrieve(batch_id)
-            
-            if batch.processing_status != "ended":
-                print(f"Chunk {chunk_num} not ready yet. Status: {batch.processing_status}")
-                continue
-            
-            # Get results for this batch
-            results = client.beta.messages.batches.results(batch_id)
-            
-            chunk_results = list(results)
-            all_results.extend(chunk_results)
-            
-            print(f"✅ Downloaded {len(chunk_results)} results from chunk {chunk_num}")
-            
-        except Exception as e:
-            print(f"❌ Error downloading chunk {chunk_num}: {e}")
-            continue
-    
-    if all_results:
-        # Save all results to file
-        with open(output_file, 'w') as f:
-            for result in all_results:
-                f.write(json.dumps(result) + '\n')
-        
-        print(f"\n✅ All results saved to {output_file}")
-        print(f"Total results: {len(all_results)}")
+def is_retryable_error(error):
+    """True for rate-limit, overload, server and connection errors"""
+    from anthropic import APIConnectionError, APIStatusError
+    if isinstance(error, APIConnectionError):
         return True
-    else:
-        print("❌ No results to save")
-        return False
+    if isinstance(error, APIStatusError):
+        return error.status_code in RETRYABLE_STATUS_CODES or error.status_code >= 500
+    return False
 
-def parse_results(results_file="geolocation_results.jsonl", mapping_file="filename_mapping.json"):
-    """Parse results and extract coordinates, mapping back to original filenames"""
-    coordinates = []
-    
-    # Load filename mapping
+def retry_after_seconds(error):
+    """Server-requested delay from a retry-after header, if any"""
+    response = getattr(error, 'response', None)
+    if response is None:
+        return None
     try:
-        with open(mapping_file, 'r') as f:
-            filename_mapping = json.load(f)
-    except:
-        print("Warning: Could not load filename mapping. Using custom_id as filename.")
-        filename_mapping = {}
-    
-    with open(results_file, 'r') as f:
-        for line in f:
-            try:
-                result = json.loads(line)
-                
-                # Extract custom_id and map to original filename
-                custom_id = result.get('custom_id', '')
-                filename = filename_mapping.get(custom_id, custom_id)
-                
-                # Extract coordinates from response
-                if result.get('result', {}).get('type') == 'message':
-                    content = result['result']['content'][0]['text']
-                    
-                    coordinates.append({
-                        'filename': filename,
-                        'response': content,
-                        'custom_id': custom_id
-                    })
-                    
-            except Exception as e:
-                print(f"Error parsing result: {e}")
-                continue
-    
-    return coordinates
+        return float(response.headers.get('retry-after'))
+    except (TypeError, ValueError):
+        return None
 
-# Main execution
-if __name__ == "__main__":
-    # STEP 1: Set your image folder path
-    IMAGE_FOLDER = "your-image-folder-path-here"
-    
-    print("Step 1: Creating batch requests...")
-    requests = create_batch_requests(IMAGE_FOLDER)
+async def submit_batch_chunks_async(requests, max_batch_bytes=MAX_BATCH_BYTES, max_batch_requests=MAX_BATCH_REQUESTS,
+                                    max_concurrency=4, max_retries=5, base_delay=1.0, max_delay=60.0,
+                                    first_chunk_num=1, on_submitted=None):
+    """Submit packed chunks concurrently with at most max_concurrency submissions in flight
+
+    Rate-limit, overload and server errors are retried with exponential backoff
+    and jitter (honoring retry-after). A 429 pauses every worker, not just the one
+    that hit it. Chunks that still fail, or fail with a non-retryable error, are
+    returned rather than dropped. Returns (batch_ids, failed_chunks).
+    At most max_concurrency chunks of payloads are held in memory at once.
+    on_submitted(batch_info) is called as soon as each batch is created.
+    """
+    batch_ids = []
+    failed_chunks = []
+    # Retries are handled here, not by the SDK
+    async_client = get_async_client(max_retries=0)
+    semaphore = asyncio.Semaphore(max_concurrency)
+    loop = asyncio.get_running_loop()
+    cooldown_until = [0.0]  # Shared pause after a rate limit
+    packer = iter_packed_chunks(requests, max_batch_bytes, max_batch_requests)
     
-    if not requests:
-        print("No requests created. Check your image folder path.")
-        exit()
+    print(f"Packing requests into batches of at most {max_batch_bytes / 1e6:.1f} MB / {max_batch_requests} requests, "
+          f"{max_concurrency} submissions in flight")
     
-    print(f"Created {len(requests)} requests")
+    async def submit_one(chunk_num, chunk, chunk_bytes, start_index):
+        try:
+            for attempt in range(max_retries + 1):
+                wait = cooldown_until[0] - loop.time()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                
+                started = time.perf_counter()
+                try:
+                    batch = await async_client.beta.messages.batches.create(requests=chunk)
+                except Exception as e:
+                    metrics.observe('submit_request', time.perf_counter() - started, outcome='error')
+                    metrics.count('submit_errors', status=getattr(e, 'status_code', 'connection'))
+                    if not is_retryable_error(e) or attempt == max_retries:
+                        metrics.count('submit_failures')
+                        print(f"❌ Error creating chunk {chunk_num} after {attempt + 1} attempt(s): {e}")
+                        failed_chunks.append({
+                            'chunk_num': chunk_num,
+                            'request_count': len(chunk),
+                            'start_index': start_index,
+                            'custom_ids': [req['custom_id'] for req in chunk],
+                            'error': str(e)
+                        })
+                        return
+                    
+                    delay = retry_after_seconds(e)
+                    if delay is None:
+                        delay = min(max_delay, base_delay * 2 ** attempt) * random.uniform(0.5, 1.0)
+                    if getattr(e, 'status_code', None) == 429:
+                        cooldown_until[0] = max(cooldown_until[0], loop.time() + delay)
+                    print(f"⏳ Chunk {chunk_num} attempt {attempt + 1} failed ({e}); retrying in {delay:.1f}s")
+                    metrics.count('submit_retries')
+                    await asyncio.sleep(delay)
+                    continue
+                
+                metrics.observe('submit_request', time.perf_counter() - started, outcome='ok')
+                record_submitted(batch.id, chunk_num, len(chunk), chunk_bytes)
+                print(f"✅ Chunk {chunk_num} submitted ({len(chunk)} requests, {chunk_bytes / 1e6:.1f} MB): "
+                      f"{batch.id} [{batch.processing_status}]")
+                batch_info = {
+                    'batch_id': batch.id,
+                    'chunk_num': chunk_num,
+                    'request_count': len(chunk),
+                    'payload_bytes': chunk_bytes,
+                    'start_index': start_index,
+                    'end_index': start_index + len(chunk) - 1,
+                    'custom_ids': [req['custom_id'] for req in chunk]
+                }
+                batch_ids.append(batch_info)
+                if on_submitted is not None:
+                    on_submitted(batch_info)
+                return
+        finally:
+            semaphore.release()
     
-    # Debug: Check custom_id lengths
-    max_custom_id_length = max(len(req['custom_id']) for req in requests)
-    print(f"Maximum custom_id length: {max_custom_id_length}")
+    tasks = []
+    chunk_num = first_chunk_num - 1
+    start_index = 0
+    while True:
+        # Only pack (and encode) the next chunk once a submission slot is free
+        await semaphore.acquire()
+        item = await asyncio.to_thread(next, packer, None)
+        if item is None:
+            semaphore.release()
+            break
+        chunk, chunk_bytes = item
+        chunk_num += 1
+        tasks.append(asyncio.create_task(submit_one(chunk_num, chunk, chunk_bytes, start_index)))
+        start_index += len(chunk)
     
-    if max_custom_id_length > 64:
-        print("❌ Warning: Some custom_ids are still too long!")
-        for req in requests:
-            if len(req['custom_id']) > 64:
-                print(f"   Too long: {req['custom_id']} ({len(req['custom_id'])} chars)")
-    else:
-        print("✅ All custom_ids are within 64 character limit")
+    await asyncio.gather(*tasks)
     
-    # STEP 2: Submit batch in chunks
-    print("\nStep 2: Submitting batches in chunks...")
-    batch_ids = submit_batch_chunks(requests, chunk_size=50)  # Adjust chunk_size if needed
+    if start_index == 0:
+        print("No requests to submit.")
     
-    if batch_ids:
-        print(f"\n✅ All batches submitted! Created {len(batch_ids)} batch chunks")
-        print("Save these Batch IDs:")
-        
-        # Save batch IDs to file for later reference
-        with open("batch_ids.json", "w") as f:
-            json.dump(batch_ids, f, indent=2)
-        print("📁 Batch IDs saved to batch_ids.json")
-        
-        for i, batch_info in enumerate(batch_ids):
-            print(f"  Chunk {batch_info['chunk_num']}: {batch_info['batch_id']}")
-        
-        # STEP 3: Check initial status
-        print("\nStep 3: Checking initial status...")
-        check_all_batches_status(batch_ids)
-        
-        print(f"\nYour batches are processing. To check status later, run:")
-        print(f"with open('batch_ids.json', 'r') as f: batch_ids = json.load(f)")
-        print(f"check_all_batches_status(batch_ids)")
-        print(f"\nTo download results when ready:")
-        print(f"download_all_results(batch_ids)")
-        
-    else:
-        print("Failed to submit batches")
+    batch_ids.sort(key=lambda b: b['chunk_num'])
+    failed_chunks.sort(key=lambda c: c['chunk_num'])
+    return batch_ids, failed_chunks
 
-# Helper functions you can call separately:
-# Load batch IDs: with open('batch_ids.json', 'r') as f: batch_ids = json.load(f)
-# check_all_batches_status(batch_ids)
-# download_all_results(batch_ids)
-# coordinates = parse_results("geolocation_results.jsonl", "filename_mapping.json")
\ No newline at end of file
+def submit_batch(requests, batch_name="geolocation_batch"):
+    """Legacy function - now redirects to chunked submission"""
+    return submit_batch_chunks(requests)
+
+# Main execution (same as: python cli.py submit <image_folder>)
+if __name__ == "__main__":
+    import sys
+    from cli import main
+    sys.exit(main(['submit'] + sys.argv[1:]))
@@ -0,0 +1,143 @@
+import os
+import json
+import tempfile
+import threading
+
+DEFAULT_MANIFEST_FILE = "run_manifest.json"
+
+# Image lifecycle: pending -> submitted -> downloaded
+IMAGE_STATES = ('pending', 'submitted', 'downloaded')
+
+class RunManifest:
+    """Persistent record of every image, batch and downloaded result in a run
+
+    Each checkpoint rewrites the manifest atomically. Re-running build/submit
+    then skips images that were already submitted, and download/watch skip
+    batches whose results were already committed to the results file.
+    results_offset is the size of the results file after the last committed
+    batch. Anything past it is a partial write from an interrupted run and is
+    truncated before downloading resumes.
+
+    Checkpoints and batch updates hold a lock: the request generator may save
+    from a worker thread while submissions are recorded on the event loop.
+    """
+
+    def __init__(self, path=DEFAULT_MANIFEST_FILE):
+        self.path = path
+        self._lock = threading.RLock()
+        try:
+            with open(path, 'r') as f:
+                self.data = json.load(f)
+        except FileNotFoundError:
+            self.data = {'images': {}, 'batches': {}, 'results_offset': 0}
+        self.filename_ids = {entry['filename']: custom_id for custom_id, entry in self.data['images'].items()}
+
+    def save(self):
+        """Atomically write the manifest so a crash never leaves it half-written"""
+        directory = os.path.dirname(os.path.abspath(self.path))
+        with self._lock:
+            fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(self.path) + ".", suffix=".tmp", dir=directory)
+            try:
+                with os.fdopen(fd, 'w') as f:
+                    json.dump(self.data, f)
+                os.replace(tmp_path, self.path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+
+    # Images
+
+    def custom_id_for(self, filename):
+        """custom_id already assigned to filename in an earlier run, if any"""
+        return self.filename_ids.get(filename)
+
+    def add_image(self, custom_id, filename):
+        with self._lock:
+            if custom_id not in self.data['images']:
+                self.data['images'][custom_id] = {'filename': filename, 'state': 'pending', 'batch_id': None}
+                self.filename_ids[filename] = custom_id
+
+    def image_state(self, custom_id):
+        entry = self.data['images'].get(custom_id)
+        return entry['state'] if entry else None
+
+    # Batches
+
+    def record_batch(self, batch_info):
+        """Checkpoint a submitted batch (batch_info must include its custom_ids)"""
+        batch_id = batch_info['batch_id']
+        with self._lock:
+            self.data['batches'][batch_id] = dict(batch_info, state='submitted')
+            for custom_id in batch_info['custom_ids']:
+                entry = self.data['images'].get(custom_id)
+                if entry is not None:
+                    entry['state'] = 'submitted'
+                    entry['batch_id'] = batch_id
+            self.save()
+
+    def next_chunk_num(self):
+        return max((b['chunk_num'] for b in self.data['batches'].values()), default=0) + 1
+
+    def batch_ids(self):
+        """All submitted batches in chunk order, in the batch_ids.json format"""
+        return sorted(self.data['batches'].values(), key=lambda b: b['chunk_num'])
+
+    def is_downloaded(self, batch_id):
+        batch = self.data['batches'].get(batch_id)
+        return batch is not None and batch['state'] == 'downloaded'
+
+    def record_download(self, batch_id, result_count, results_offset):
+        """Checkpoint a batch whose results have been fully appended to the results file"""
+        with self._lock:
+            batch = self.data['batches'][batch_id]
+            batch['state'] = 'downloaded'
+            batch['result_count'] = result_count
+            for custom_id in batch.get('custom_ids', []):
+                entry = self.data['images'].get(custom_id)
+                if entry is not None:
+                    entry['state'] = 'downloaded'
+            self.data['results_offset'] = results_offset
+            self.save()
+
+    # Results file
+
+    def prepare_results_file(self, output_file):
+        """Trim output_file back to the last committed batch so downloads can resume by appending
+
+        If the file is missing or shorter than the committed offset, earlier downloads
+        were lost, so every batch is marked for download again.
+        """
+        offset = self.data['results_offset']
+        size = os.path.getsize(output_file) if os.path.exists(output_file) else 0
+        if size < offset:
+            print(f"⚠️  {output_file} is missing committed results; all batches will be downloaded again")
+            for batch in self.data['batches'].values():
+                if batch['state'] == 'downloaded':
+                    batch['state'] = 'submitted'
+            for entry in self.data['images'].values():
+                if entry['state'] == 'downloaded':
+                    entry['state'] = 'submitted'
+            self.data['results_offset'] = offset = 0
+            self.save()
+        with open(output_file, 'a') as f:
+            f.truncate(offset)
+
+    # Settings
+
+    def record_preprocess(self, preprocess):
+        """Remember the preprocess settings images were submitted with (None for originals)"""
+        with self._lock:
+            self.data['preprocess'] = dict(preprocess) if preprocess else None
+
+    def submitted_preprocess(self):
+        """Preprocess settings of the last build/submit, or None (originals, or not recorded)"""
+        return self.data.get('preprocess')
+
+    def summary(self):
+        counts = {state: 0 for state in IMAGE_STATES}
+        for entry in self.data['images'].values():
+            counts[entry['state']] += 1
+        batches = self.data['batches'].values()
+        downloaded = sum(1 for b in batches if b['state'] == 'downloaded')
+        return (f"{len(self.data['images'])} images ({counts['pending']} pending, {counts['submitted']} submitted, "
+                f"{counts['downloaded']} downloaded), {len(self.data['batches'])} batches ({downloaded} downloaded)")
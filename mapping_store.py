@@ -0,0 +1,391 @@
+import os
+import re
+import json
+import mmap
+import struct
+import hashlib
+from abc import ABC, abstractmethod
+from collections import namedtuple
+
+DEFAULT_MAPPING_STORE = "filename_mapping"
+
+MappingEntry = namedtuple('MappingEntry', ['custom_id', 'filename', 'content_hash', 'true_lat', 'true_lon'])
+
+# Data file (<path>.dat): append-only records, each a fixed header followed by
+# the custom_id and filename bytes. A later record for the same custom_id wins.
+RECORD_HEADER = struct.Struct('<HH32sdd')  # custom_id len, filename len, sha256, lat, lon
+
+# Index file (<path>.idx): open-addressing hash table of (key hash, data offset + 1)
+# slots, memory-mapped so a lookup touches only the probed slots.
+INDEX_MAGIC = b'GBMI'
+INDEX_VERSION = 1
+INDEX_HEADER = struct.Struct('<4sIQQQ')  # magic, version, capacity, count, indexed data bytes
+SLOT = struct.Struct('<QQ')
+INITIAL_CAPACITY = 1024
+MAX_LOAD = 0.7
+
+# Ground truth is encoded in the dataset filenames: image_<id>_<lat>_<lon>.jpg
+# (some files carry a browser duplicate suffix, e.g. "..._140.0760(1).jpg")
+FILENAME_PATTERN = re.compile(
+    r'^image_(\d+)_([-+]?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?)_([-+]?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?)'
+    r'(?:\s*\(\d+\))?\.\w+$'
+)
+
+def parse_ground_truth(filename):
+    """True (lat, lon) from a dataset filename, or (nan, nan) if it does not follow the pattern"""
+    match = FILENAME_PATTERN.match(filename)
+    if match is None:
+        return float('nan'), float('nan')
+    return float(match.group(2)), float(match.group(3))
+
+def key_hash(custom_id):
+    """64-bit hash of a custom_id (never 0, which marks an empty slot's hash)"""
+    return int.from_bytes(hashlib.blake2b(custom_id.encode('utf-8'), digest_size=8).digest(), 'little') or 1
+
+class IndexedLog(ABC):
+    """Append-only data file of records keyed by custom_id, plus a memory-mapped hash index
+
+    Lookups hash the custom_id and probe the mapped index, so they cost O(1)
+    no matter how many records the file holds and never read the whole file.
+    Appending a record updates its index slot in place, pointing the key at the
+    newest record. The index doubles (rebuilt from the data file) when it gets
+    70% full, and index entries missing after a crash are rebuilt from the data
+    file on open.
+
+    With readonly=True neither file is ever modified, so a reader can run
+    while another process appends. Records past the indexed end (or every
+    record, if the index is unusable) are found by scanning the data file into
+    an in-memory tail index, and an incomplete record at the end is skipped
+    rather than truncated.
+
+    Subclasses define the record format through _read_record, which must
+    return (entry, record length) with the key in entry.custom_id.
+    """
+
+    def __init__(self, path, readonly=False):
+        self.data_path = path + ".dat"
+        self.index_path = path + ".idx"
+        self.readonly = readonly
+        self.index_file = None
+        self.index = None
+        self.tail = {}  # custom_id -> offset of records not in the index (read-only opens)
+        if readonly:
+            self.data_fd = os.open(self.data_path, os.O_RDONLY)
+            self._open_index()
+            self._scan_tail()
+            return
+        self.data_fd = os.open(self.data_path, os.O_RDWR | os.O_CREAT, 0o644)
+        if not self._open_index():
+            self._rebuild_index(INITIAL_CAPACITY)
+        self._recover_tail()
+
+    # Index management
+
+    def _open_index(self):
+        """Map an existing index file; False if it is missing or unusable"""
+        try:
+            self.index_file = open(self.index_path, 'rb' if self.readonly else 'r+b')
+        except FileNotFoundError:
+            return False
+        try:
+            access = mmap.ACCESS_READ if self.readonly else mmap.ACCESS_WRITE
+            self.index = mmap.mmap(self.index_file.fileno(), 0, access=access)
+        except ValueError:  # Empty file
+            self.index_file.close()
+            return False
+        magic, version, capacity, _, data_end = INDEX_HEADER.unpack_from(self.index, 0)
+        if (magic != INDEX_MAGIC or version != INDEX_VERSION
+                or len(self.index) != INDEX_HEADER.size + capacity * SLOT.size
+                or data_end > os.fstat(self.data_fd).st_size):
+            self.close_index()
+            return False
+        return True
+
+    def close_index(self):
+        if self.index is not None:
+            self.index.close()
+            self.index = None
+        if self.index_file is not None:
+            self.index_file.close()
+            self.index_file = None
+
+    def _header(self):
+        return INDEX_HEADER.unpack_from(self.index, 0)
+
+    def _set_header(self, capacity, count, data_end):
+        INDEX_HEADER.pack_into(self.index, 0, INDEX_MAGIC, INDEX_VERSION, capacity, count, data_end)
+
+    def _rebuild_index(self, capacity):
+        """Write a fresh index of the given capacity from every record in the data file"""
+        self.close_index()
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            f.truncate(INDEX_HEADER.size + capacity * SLOT.size)
+        os.replace(tmp_path, self.index_path)
+        self.index_file = open(self.index_path, 'r+b')
+        self.index = mmap.mmap(self.index_file.fileno(), 0)
+        self._set_header(capacity, 0, 0)
+        self._recover_tail()
+
+    def _scan_tail(self):
+        """Read-only counterpart of _recover_tail: index unindexed records in memory only"""
+        offset = self._header()[4] if self.index is not None else 0
+        size = os.fstat(self.data_fd).st_size
+        while offset < size:
+            record = self._read_record(offset)
+            if record is None:
+                break  # Torn write, or a writer still appending this record
+            entry, length = record
+            self.tail[entry.custom_id] = offset
+            offset += length
+
+    def _recover_tail(self):
+        """Index records appended after the last index update (e.g. before a crash)"""
+        capacity, count, data_end = self._header()[2:]
+        size = os.fstat(self.data_fd).st_size
+        offset = data_end
+        while offset < size:
+            record = self._read_record(offset)
+            if record is None:
+                # Torn write at the end of the file: drop it
+                os.ftruncate(self.data_fd, offset)
+                break
+            entry, length = record
+            count += self._insert_slot(entry.custom_id, offset, capacity)
+            offset += length
+            self._set_header(capacity, count, offset)
+            if count > capacity * MAX_LOAD:
+                self._rebuild_index(capacity * 2)
+                return
+        self._set_header(capacity, count, offset)
+
+    def _insert_slot(self, custom_id, offset, capacity):
+        """Point custom_id's slot at offset; returns 1 if the key is new, 0 if it replaced one"""
+        h = key_hash(custom_id)
+        i = h % capacity
+        while True:
+            position = INDEX_HEADER.size + i * SLOT.size
+            slot_hash, slot_offset = SLOT.unpack_from(self.index, position)
+            if slot_offset == 0:
+                SLOT.pack_into(self.index, position, h, offset + 1)
+                return 1
+            if slot_hash == h and self._read_record(slot_offset - 1)[0].custom_id == custom_id:
+                SLOT.pack_into(self.index, position, h, offset + 1)
+                return 0
+            i = (i + 1) % capacity
+
+    def _find_offset(self, custom_id):
+        """Data offset of the newest record for custom_id, or None"""
+        offset = self.tail.get(custom_id)
+        if offset is not None:
+            return offset
+        return self._find_indexed_offset(custom_id)
+
+    def _find_indexed_offset(self, custom_id):
+        if self.index is None:
+            return None
+        capacity = self._header()[2]
+        h = key_hash(custom_id)
+        i = h % capacity
+        while True:
+            slot_hash, slot_offset = SLOT.unpack_from(self.index, INDEX_HEADER.size + i * SLOT.size)
+            if slot_offset == 0:
+                return None
+            if slot_hash == h and self._read_record(slot_offset - 1)[0].custom_id == custom_id:
+                return slot_offset - 1
+            i = (i + 1) % capacity
+
+    def _find(self, custom_id):
+        """Newest entry for custom_id, or None"""
+        offset = self._find_offset(custom_id)
+        return None if offset is None else self._read_record(offset)[0]
+
+    def _append(self, custom_id, record):
+        """Write a record at the end of the data file and point custom_id's slot at it"""
+        if self.readonly:
+            raise ValueError(f"{self.data_path} is open read-only")
+        capacity, count, data_end = self._header()[2:]
+        os.pwrite(self.data_fd, record, data_end)
+        count += self._insert_slot(custom_id, data_end, capacity)
+        self._set_header(capacity, count, data_end + len(record))
+        if count > capacity * MAX_LOAD:
+            self._rebuild_index(capacity * 2)
+        return data_end
+
+    def _indexed_offsets(self):
+        """Data offset of the newest record of every key, in file order"""
+        offsets = []
+        if self.index is not None:
+            capacity = self._header()[2]
+            for i in range(capacity):
+                slot_offset = SLOT.unpack_from(self.index, INDEX_HEADER.size + i * SLOT.size)[1]
+                if slot_offset:
+                    offsets.append(slot_offset - 1)
+        if self.tail:
+            # Keys rewritten after the indexed end point at their tail record instead
+            offsets = [offset for offset in offsets if self._read_record(offset)[0].custom_id not in self.tail]
+            offsets.extend(self.tail.values())
+        return sorted(offsets)
+
+    @abstractmethod
+    def _read_record(self, offset):
+        """(entry, record length) at offset, or None if the record is incomplete"""
+
+    def __contains__(self, custom_id):
+        return self._find(custom_id) is not None
+
+    def __len__(self):
+        count = self._header()[3] if self.index is not None else 0
+        return count + sum(1 for custom_id in self.tail if self._find_indexed_offset(custom_id) is None)
+
+    def flush(self):
+        if self.readonly:
+            return
+        self.index.flush()
+        os.fsync(self.data_fd)
+
+    def close(self):
+        if self.index is not None and not self.readonly:
+            self.index.flush()
+        self.close_index()
+        if self.data_fd is not None:
+            os.close(self.data_fd)
+            self.data_fd = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class MappingStore(IndexedLog):
+    """Append-only, memory-mapped custom_id -> (filename, content hash, true lat/lon) store
+
+    See IndexedLog for the index; a later record for a custom_id replaces the
+    earlier one.
+
+    get(custom_id, default) returns the filename, so a store can stand in for
+    the filename_mapping dict anywhere; lookup() returns the full MappingEntry.
+    """
+
+    def __init__(self, path=DEFAULT_MAPPING_STORE, readonly=False):
+        super().__init__(path, readonly)
+
+    def _read_record(self, offset):
+        """(MappingEntry, record length) at offset, or None if the record is incomplete"""
+        header = os.pread(self.data_fd, RECORD_HEADER.size, offset)
+        if len(header) < RECORD_HEADER.size:
+            return None
+        id_len, name_len, content_hash, lat, lon = RECORD_HEADER.unpack(header)
+        body = os.pread(self.data_fd, id_len + name_len, offset + RECORD_HEADER.size)
+        if len(body) < id_len + name_len:
+            return None
+        entry = MappingEntry(
+            body[:id_len].decode('utf-8'),
+            body[id_len:].decode('utf-8'),
+            content_hash.hex() if content_hash.strip(b'\0') else None,
+            lat, lon
+        )
+        return entry, RECORD_HEADER.size + id_len + name_len
+
+    def put(self, custom_id, filename, content_hash=None, true_lat=None, true_lon=None):
+        """Add or replace an entry without rewriting existing data
+
+        Ground-truth coordinates default to the ones encoded in the filename.
+        """
+        if true_lat is None or true_lon is None:
+            true_lat, true_lon = parse_ground_truth(filename)
+        id_bytes = custom_id.encode('utf-8')
+        name_bytes = filename.encode('utf-8')
+        raw_hash = bytes.fromhex(content_hash) if content_hash else b'\0' * 32
+        record = RECORD_HEADER.pack(len(id_bytes), len(name_bytes), raw_hash, true_lat, true_lon) + id_bytes + name_bytes
+        self._append(custom_id, record)
+
+    def lookup(self, custom_id):
+        """Full MappingEntry for custom_id, or None"""
+        return self._find(custom_id)
+
+    def get(self, custom_id, default=None):
+        """Filename for custom_id (dict-compatible)"""
+        entry = self.lookup(custom_id)
+        return default if entry is None else entry.filename
+
+    def entries(self):
+        """Current entry for every custom_id, in the order they were last written"""
+        for offset in self._indexed_offsets():
+            yield self._read_record(offset)[0]
+
+    def to_dict(self):
+        return {entry.custom_id: entry.filename for entry in self.entries()}
+
+def import_json_mapping(json_file="filename_mapping.json", path=DEFAULT_MAPPING_STORE):
+    """Load an existing filename_mapping.json into a store, adding only custom_ids it lacks"""
+    with open(json_file, 'r') as f:
+        filename_mapping = json.load(f)
+    added = 0
+    with MappingStore(path) as store:
+        for custom_id, filename in filename_mapping.items():
+            if custom_id not in store:
+                store.put(custom_id, filename)
+                added += 1
+    print(f"📁 Imported {added} new mappings from {json_file} into {path}.dat")
+    return added
+
+class FilenameMapping:
+    """Read-only custom_id -> filename lookup over a MappingStore with a JSON fallback
+
+    ids missing from the store (e.g. mappings written before the store
+    existed) are looked up in the JSON file, which is only loaded on the
+    first miss. Close it, or use it as a context manager, to release the store.
+    """
+
+    def __init__(self, store=None, mapping_file=None, fallback=None):
+        self.store = store
+        self.mapping_file = mapping_file
+        self.fallback = fallback
+
+    def _fallback(self):
+        if self.fallback is None:
+            self.fallback = {}
+            if self.mapping_file is not None and os.path.exists(self.mapping_file):
+                with open(self.mapping_file, 'r') as f:
+                    self.fallback = json.load(f)
+        return self.fallback
+
+    def get(self, custom_id, default=None):
+        """Filename for custom_id (dict-compatible)"""
+        if self.store is not None:
+            filename = self.store.get(custom_id)
+            if filename is not None:
+                return filename
+        return self._fallback().get(custom_id, default)
+
+    def __contains__(self, custom_id):
+        return self.get(custom_id) is not None
+
+    def close(self):
+        if self.store is not None:
+            self.store.close()
+            self.store = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def load_filename_mapping(mapping_file="filename_mapping.json"):
+    """custom_id -> filename lookup, preferring the indexed store over a full JSON load
+
+    Looks for <mapping_file without .json>.idx/.dat next to the JSON file and
+    opens it read-only, so it is safe while a submit is still appending.
+    """
+    path = os.path.splitext(mapping_file)[0]
+    if os.path.exists(path + ".dat"):
+        return FilenameMapping(MappingStore(path, readonly=True), mapping_file)
+    with open(mapping_file, 'r') as f:
+        return FilenameMapping(fallback=json.load(f))
+
+if __name__ == "__main__":
+    # Convert the existing JSON mapping into an indexed store
+    import_json_mapping()
@@ -0,0 +1,188 @@
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+# Lightweight counters and timers for the pipeline's hot paths. Everything goes
+# into one process-wide registry (metrics below) and is written at the end of a
+# run as JSON, or as a Prometheus textfile when the file name ends in .prom:
+#   with metrics.stage('build'): ...
+#   metrics.count('bytes_uploaded', chunk_bytes)
+#   metrics.dump("submit_metrics.prom")
+#
+# Set GEOBATCH_PROFILE to profile a single stage, e.g. GEOBATCH_PROFILE=build
+# (cProfile, written to profile_build.prof) or GEOBATCH_PROFILE=submit:tracemalloc
+# (top allocations written to profile_submit_tracemalloc.txt). Only stages run
+# under metrics.stage (PROFILED_STAGES) can be profiled; encoding runs on pool
+# workers and inside submit, so profile it through build or submit.
+
+METRICS_PREFIX = "geobatch"
+PROFILE_ENV = "GEOBATCH_PROFILE"
+MAX_EVENTS = 100_000  # Per-batch events are kept; per-image ones should be counters
+PROFILED_STAGES = ('build', 'submit', 'retry', 'watch', 'download', 'merge', 'parse', 'incremental_parse')
+PROFILE_MODES = ('cprofile', 'tracemalloc')
+
+def metric_key(name, labels):
+    """Prometheus-style series name, e.g. submit_request{outcome="ok"}"""
+    if not labels:
+        return name
+    return name + '{' + ','.join(f'{k}="{v}"' for k, v in sorted(labels.items())) + '}'
+
+class Metrics:
+    """Thread-safe registry of counters, timers and timestamped events"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+        check_profile_setting()
+
+    def reset(self):
+        with self.lock:
+            self.counters = {}
+            self.timers = {}
+            self.events = []
+            self.started = time.time()
+
+    def count(self, name, value=1, **labels):
+        key = metric_key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        """Record one duration for a timer"""
+        key = metric_key(name, labels)
+        with self.lock:
+            timer = self.timers.get(key)
+            if timer is None:
+                self.timers[key] = {'count': 1, 'sum': seconds, 'min': seconds, 'max': seconds}
+            else:
+                timer['count'] += 1
+                timer['sum'] += seconds
+                timer['min'] = min(timer['min'], seconds)
+                timer['max'] = max(timer['max'], seconds)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    @contextmanager
+    def stage(self, name):
+        """Time a pipeline stage (stage_seconds{stage=name}), profiling it if GEOBATCH_PROFILE selects it"""
+        with self.timer('stage', stage=name), profile(name):
+            yield
+
+    def event(self, name, **fields):
+        """Timestamped record, e.g. when each batch was submitted or ended"""
+        with self.lock:
+            if len(self.events) < MAX_EVENTS:
+                self.events.append({'event': name, 'time': time.time(), **fields})
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'started_at': datetime.fromtimestamp(self.started, timezone.utc).isoformat(),
+                'written_at': datetime.now(timezone.utc).isoformat(),
+                'counters': dict(self.counters),
+                'timers': {key: dict(timer) for key, timer in self.timers.items()},
+                'events': list(self.events),
+            }
+
+    def to_prometheus(self):
+        """Prometheus text exposition: counters as <name>_total, timers as <name>_seconds summaries"""
+        snapshot = self.snapshot()
+        lines = []
+        seen = set()
+
+        def declare(name, kind):
+            if name not in seen:
+                seen.add(name)
+                lines.append(f"# TYPE {name} {kind}")
+
+        def split(key):
+            name, brace, labels = key.partition('{')
+            return name, brace + labels
+
+        for key, value in sorted(snapshot['counters'].items()):
+            name, labels = split(key)
+            series = f"{METRICS_PREFIX}_{name}_total"
+            declare(series, 'counter')
+            lines.append(f"{series}{labels} {value}")
+        for key, timer in sorted(snapshot['timers'].items()):
+            name, labels = split(key)
+            series = f"{METRICS_PREFIX}_{name}_seconds"
+            declare(series, 'summary')
+            lines.append(f"{series}_count{labels} {timer['count']}")
+            lines.append(f"{series}_sum{labels} {timer['sum']:.6f}")
+            declare(series + '_max', 'gauge')
+            lines.append(f"{series}_max{labels} {timer['max']:.6f}")
+        return '\n'.join(lines) + '\n'
+
+    def dump(self, path="run_metrics.json"):
+        """Write metrics atomically (textfile collectors must never see a partial file)"""
+        if path.endswith('.prom'):
+            data = self.to_prometheus()
+        else:
+            data = json.dumps(self.snapshot(), indent=2)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        print(f"📊 Metrics saved to {path}")
+
+def check_profile_setting():
+    """Warn when GEOBATCH_PROFILE names a stage or mode that would never be profiled"""
+    setting = os.environ.get(PROFILE_ENV, '')
+    if not setting:
+        return
+    target, _, mode = setting.partition(':')
+    if target not in PROFILED_STAGES:
+        print(f"⚠️  {PROFILE_ENV}={setting}: '{target}' is not a profiled stage "
+              f"(choose from {', '.join(PROFILED_STAGES)}); nothing will be profiled")
+    elif mode and mode not in PROFILE_MODES:
+        print(f"⚠️  {PROFILE_ENV}={setting}: unknown mode '{mode}' "
+              f"(choose from {', '.join(PROFILE_MODES)}); using cprofile")
+
+@contextmanager
+def profile(stage):
+    """Profile the enclosed block if GEOBATCH_PROFILE names this stage (cprofile or tracemalloc)"""
+    target, _, mode = os.environ.get(PROFILE_ENV, '').partition(':')
+    if target != stage:
+        yield
+        return
+
+    if (mode or 'cprofile') == 'tracemalloc':
+        import tracemalloc
+        tracemalloc.start()
+        try:
+            yield
+        finally:
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            output = f"profile_{stage}_tracemalloc.txt"
+            with open(output, 'w') as f:
+                f.write(f"current {current / 1e6:.1f} MB, peak {peak / 1e6:.1f} MB\n\n")
+                for stat in snapshot.statistics('lineno')[:50]:
+                    f.write(f"{stat}\n")
+            print(f"🔬 Allocation profile of {stage} saved to {output} (peak {peak / 1e6:.1f} MB)")
+        return
+
+    import cProfile
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        output = f"profile_{stage}.prof"
+        profiler.dump_stats(output)
+        print(f"🔬 CPU profile of {stage} saved to {output} (view with python -m pstats {output})")
+
+# Process-wide registry used by every module
+metrics = Metrics()
@@ -0,0 +1,246 @@
+import re
+import json
+import time
+import uuid
+import random
+import hashlib
+import argparse
+import threading
+from datetime import datetime, timezone, timedelta
+from urllib.parse import urlparse
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# Local stand-in for the Message Batches API (create / retrieve / results) so the
+# pipeline can be exercised offline. Run it, then point the pipeline at it:
+#   python mock_server.py --port 8765 --processing-delay 30 --rate-limit-rate 0.05
+#   ANTHROPIC_BASE_URL=http://127.0.0.1:8765 python main.py
+
+BATCH_PATH = re.compile(r'^/v1/messages/batches/([^/]+)$')
+RESULTS_PATH = re.compile(r'^/v1/messages/batches/([^/]+)/results$')
+
+DEFAULT_CONFIG = {
+    'latency': 0.0,               # Seconds added to every response
+    'processing_delay': 5.0,      # Seconds from creation until a batch ends
+    'per_request_delay': 0.0,     # Extra processing seconds per request in the batch
+    'error_rate': 0.0,            # Fraction of individual requests that end 'errored'
+    'rate_limit_rate': 0.0,       # Fraction of API calls answered with 429
+    'server_error_rate': 0.0,     # Fraction of API calls answered with 500
+    'retry_after': 1.0,           # retry-after header on 429s
+    'seed': 0,
+}
+
+def iso(ts):
+    return datetime.fromtimestamp(ts, timezone.utc).isoformat().replace('+00:00', 'Z')
+
+def fake_answer(custom_id, seed):
+    """Deterministic pseudo-random geolocation answer for a custom_id"""
+    rng = random.Random(hashlib.md5(f"{seed}:{custom_id}".encode()).digest())
+    return (f"Based on the visual features, my best estimate is:\n\n"
+            f"Latitude: {rng.uniform(-60, 70):.4f}\nLongitude: {rng.uniform(-180, 180):.4f}")
+
+class MockBatchStore:
+    """In-memory batches; only custom_ids are kept, never image payloads"""
+
+    def __init__(self, config):
+        self.config = config
+        self.batches = {}
+        self.lock = threading.Lock()
+        self.rng = random.Random(config['seed'])
+        self.stats = {'create': 0, 'retrieve': 0, 'results': 0, 'requests': 0, 'rate_limited': 0, 'server_errors': 0}
+
+    def create(self, custom_ids):
+        batch_id = f"msgbatch_mock_{uuid.uuid4().hex[:24]}"
+        now = time.time()
+        duration = self.config['processing_delay'] + self.config['per_request_delay'] * len(custom_ids)
+        with self.lock:
+            self.batches[batch_id] = {'custom_ids': custom_ids, 'created': now, 'ends': now + duration}
+        self.count('create')
+        self.count('requests', len(custom_ids))
+        return self.describe(batch_id)
+
+    def count(self, name, n=1):
+        with self.lock:
+            self.stats[name] += n
+
+    def errored_ids(self, batch_id):
+        """Which requests in a batch fail is fixed per batch, so counts and results agree"""
+        batch = self.batches[batch_id]
+        if 'errored' not in batch:
+            rng = random.Random(f"{self.config['seed']}:{batch_id}")
+            batch['errored'] = {c for c in batch['custom_ids'] if rng.random() < self.config['error_rate']}
+        return batch['errored']
+
+    def describe(self, batch_id, base_url=""):
+        batch = self.batches.get(batch_id)
+        if batch is None:
+            return None
+        ended = time.time() >= batch['ends']
+        total = len(batch['custom_ids'])
+        errored = len(self.errored_ids(batch_id)) if ended else 0
+        return {
+            'id': batch_id,
+            'type': 'message_batch',
+            'processing_status': 'ended' if ended else 'in_progress',
+            'request_counts': {
+                'processing': 0 if ended else total,
+                'succeeded': total - errored if ended else 0,
+                'errored': errored,
+                'canceled': 0,
+                'expired': 0,
+            },
+            'created_at': iso(batch['created']),
+            'expires_at': iso(batch['created'] + timedelta(days=1).total_seconds()),
+            'ended_at': iso(batch['ends']) if ended else None,
+            'archived_at': None,
+            'cancel_initiated_at': None,
+            'results_url': f"{base_url}/v1/messages/batches/{batch_id}/results" if ended else None,
+        }
+
+    def iter_results(self, batch_id):
+        errored = self.errored_ids(batch_id)
+        for custom_id in self.batches[batch_id]['custom_ids']:
+            if custom_id in errored:
+                result = {'type': 'errored', 'error': {'type': 'error', 'error': {
+                    'type': 'api_error', 'message': 'Mock internal error'}}}
+            else:
+                result = {'type': 'succeeded', 'message': {
+                    'id': f"msg_mock_{custom_id}",
+                    'type': 'message',
+                    'role': 'assistant',
+                    'model': 'claude-sonnet-4-20250514',
+                    'content': [{'type': 'text', 'text': fake_answer(custom_id, self.config['seed'])}],
+                    'stop_reason': 'end_turn',
+                    'stop_sequence': None,
+                    'usage': {'input_tokens': 1600, 'output_tokens': 120},
+                }}
+            yield json.dumps({'custom_id': custom_id, 'result': result}) + '\n'
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    store = None  # Set by serve()
+
+    def log_message(self, format, *args):
+        pass  # Keep the console quiet under load
+
+    def send_json(self, status, body, headers=None):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_error_json(self, status, error_type, message, headers=None):
+        self.send_json(status, {'type': 'error', 'error': {'type': error_type, 'message': message}}, headers)
+
+    def inject_faults(self):
+        """Apply latency and randomly answer with 429/500; True if the request was handled"""
+        config = self.store.config
+        if config['latency']:
+            time.sleep(config['latency'])
+        roll = self.store.rng.random()
+        if roll < config['rate_limit_rate']:
+            self.store.count('rate_limited')
+            self.send_error_json(429, 'rate_limit_error', 'Mock rate limit',
+                                 {'retry-after': str(config['retry_after'])})
+            return True
+        if roll < config['rate_limit_rate'] + config['server_error_rate']:
+            self.store.count('server_errors')
+            self.send_error_json(500, 'api_error', 'Mock server error')
+            return True
+        return False
+
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def do_POST(self):
+        path = urlparse(self.path).path
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length)  # Always drain the body so the connection stays usable
+        if path != '/v1/messages/batches':
+            self.send_error_json(404, 'not_found_error', f"Unknown path {path}")
+            return
+        if self.inject_faults():
+            return
+        try:
+            requests = json.loads(body)['requests']
+            custom_ids = [req['custom_id'] for req in requests]
+        except (ValueError, KeyError, TypeError) as e:
+            self.send_error_json(400, 'invalid_request_error', f"Malformed batch: {e}")
+            return
+        self.send_json(200, self.store.create(custom_ids))
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        match = RESULTS_PATH.match(path)
+        if match:
+            self.send_results(match.group(1))
+            return
+        match = BATCH_PATH.match(path)
+        if match is None:
+            self.send_error_json(404, 'not_found_error', f"Unknown path {path}")
+            return
+        if self.inject_faults():
+            return
+        self.store.count('retrieve')
+        batch = self.store.describe(match.group(1), self.base_url())
+        if batch is None:
+            self.send_error_json(404, 'not_found_error', f"No batch {match.group(1)}")
+            return
+        self.send_json(200, batch)
+
+    def send_results(self, batch_id):
+        if self.inject_faults():
+            return
+        batch = self.store.describe(batch_id)
+        if batch is None or batch['processing_status'] != 'ended':
+            self.send_error_json(404, 'not_found_error', f"No results for {batch_id}")
+            return
+        self.store.count('results')
+        # Stream with chunked encoding so large result sets are never built in memory
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/binary')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        buffer = []
+        for line in self.store.iter_results(batch_id):
+            buffer.append(line)
+            if len(buffer) >= 1000:
+                self.write_chunk(''.join(buffer).encode())
+                buffer = []
+        if buffer:
+            self.write_chunk(''.join(buffer).encode())
+        self.wfile.write(b'0\r\n\r\n')
+
+    def write_chunk(self, data):
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+
+def serve(host='127.0.0.1', port=8765, **config):
+    """Start the mock server in a background thread; returns (server, store)"""
+    store = MockBatchStore(dict(DEFAULT_CONFIG, **config))
+    handler = type('ConfiguredMockHandler', (MockHandler,), {'store': store})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, store
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local mock of the Message Batches API")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    for name, default in DEFAULT_CONFIG.items():
+        parser.add_argument(f"--{name.replace('_', '-')}", type=type(default), default=default)
+    args = vars(parser.parse_args())
+
+    server, store = serve(**args)
+    print(f"🧪 Mock Batches API listening on http://{args['host']}:{args['port']}")
+    print(f"   export ANTHROPIC_BASE_URL=http://{args['host']}:{args['port']}")
+    try:
+        while True:
+            time.sleep(10)
+            print(f"   {store.stats}")
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,250 @@
+import os
+import json
+import numpy as np
+
+from main import (build_request, create_short_custom_id, request_size, IMAGE_EXTENSIONS, MAX_BATCH_BYTES,
+                  MAX_BATCH_REQUESTS)
+from encoding import get_image_media_type
+from encoding_cache import EncodingCache, DEFAULT_CACHE_DIR
+
+try:
+    from PIL import Image
+except ImportError:  # Only needed to read image dimensions when planning a --preprocess run
+    Image = None
+
+# Dry run: predict what `submit` would send without reading or encoding any
+# image. File sizes come from one os.scandir pass, and images already in the
+# encoding cache use the exact payload size recorded there. With preprocessing,
+# the size of the other images is estimated from their dimensions (read from the
+# image header only) at a bits-per-pixel rate. Timings are extrapolated from the
+# metrics files written by the last submit and download/watch runs.
+
+# Typical size of a photo re-encoded at the default preprocessing (1568px, JPEG q85).
+# Replaced by the rate measured on images already in the encoding cache, if any.
+PREPROCESSED_BITS_PER_PIXEL = 3.5
+
+SUBMIT_METRICS_FILE = "submit_metrics.json"
+DOWNLOAD_METRICS_FILE = "download_metrics.json"
+
+def scan_image_folder(image_folder_path):
+    """(filenames, file sizes) of the images in a folder, sorted like main.list_image_files"""
+    entries = []
+    with os.scandir(image_folder_path) as it:
+        for entry in it:
+            if os.path.splitext(entry.name)[1].lower() in IMAGE_EXTENSIONS and entry.is_file():
+                entries.append((entry.name, entry.stat().st_size))
+    entries.sort()
+    return [name for name, _ in entries], np.array([size for _, size in entries], dtype=np.int64)
+
+def base64_length(n_bytes):
+    return 4 * ((np.asarray(n_bytes, dtype=np.int64) + 2) // 3)
+
+def output_pixels(image_path, preprocess):
+    """(pixel count after preprocessing, whether it is downscaled), from the image header alone"""
+    if Image is None:
+        raise RuntimeError("Planning a preprocessed run requires Pillow (pip install Pillow)")
+    with Image.open(image_path) as image:  # Parses the header only; pixel data is never decoded
+        width, height = image.size
+    max_long_edge = preprocess.get('max_long_edge')
+    if not max_long_edge or max(width, height) <= max_long_edge:
+        return width * height, False
+    scale = max_long_edge / max(width, height)
+    return int(width * scale) * int(height * scale), True
+
+def request_envelope_bytes(media_type):
+    """Serialized size of a request with an empty custom_id and no image data (the JSON overhead)
+
+    Only the custom_id and media type vary between requests, and neither needs
+    escaping, so a request's size is this plus its custom_id and base64 lengths.
+    """
+    return request_size(build_request("", "", media_type))
+
+def plan_chunks(sizes, max_batch_bytes=MAX_BATCH_BYTES, max_batch_requests=MAX_BATCH_REQUESTS):
+    """(chunk request counts, chunk bytes, oversized count) from the same greedy rule as main.iter_packed_chunks"""
+    counts, chunk_bytes = [], []
+    count = total = oversized = 0
+    for size in (sizes + 1).tolist():  # Each request is followed by a comma in the JSON array
+        if size > max_batch_bytes:
+            oversized += 1
+            continue
+        if count and (total + size > max_batch_bytes or count >= max_batch_requests):
+            counts.append(count)
+            chunk_bytes.append(total)
+            count = total = 0
+        count += 1
+        total += size
+    if count:
+        counts.append(count)
+        chunk_bytes.append(total)
+    return np.array(counts, dtype=np.int64), np.array(chunk_bytes, dtype=np.int64), oversized
+
+def load_metrics(path):
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+def load_throughput(submit_metrics_file=SUBMIT_METRICS_FILE, download_metrics_file=DOWNLOAD_METRICS_FILE):
+    """Rates observed in earlier runs; a rate is missing when nothing recorded it
+
+    encode_sec_per_image: encode-only time per image (submit runs; EncodeStats.encode_seconds,
+        which excludes the packing and uploads interleaved with encoding)
+    upload_bytes_per_sec: bytes per second of one batch creation request
+    processing_sec_per_request: API processing time from submit to batch end,
+        per request in the batch (needs a submit and a watch from the same run)
+    download_sec_per_result: seconds per downloaded result for one batch stream
+    """
+    throughput = {}
+    submit = load_metrics(submit_metrics_file) or {}
+    download = load_metrics(download_metrics_file) or {}
+
+    images = submit.get('counters', {}).get('images_encoded', 0)
+    encode_seconds = submit.get('timers', {}).get('stage{stage="encode"}', {}).get('sum', 0)
+    if images and encode_seconds:
+        throughput['encode_sec_per_image'] = encode_seconds / images
+
+    uploaded = submit.get('counters', {}).get('bytes_uploaded', 0)
+    submit_seconds = submit.get('timers', {}).get('submit_request{outcome="ok"}', {}).get('sum', 0)
+    if uploaded and submit_seconds:
+        throughput['upload_bytes_per_sec'] = uploaded / submit_seconds
+
+    submitted = {e['batch_id']: e for e in submit.get('events', []) if e.get('event') == 'batch_submitted'}
+    latencies = [(e['time'] - submitted[e['batch_id']]['time']) / max(submitted[e['batch_id']]['request_count'], 1)
+                 for e in download.get('events', [])
+                 if e.get('event') == 'batch_ended' and e.get('batch_id') in submitted]
+    if latencies:
+        throughput['processing_sec_per_request'] = float(np.median(latencies))
+
+    results = download.get('counters', {}).get('results_downloaded', 0)
+    download_seconds = download.get('timers', {}).get('download_batch', {}).get('sum', 0)
+    if results and download_seconds:
+        throughput['download_sec_per_result'] = download_seconds / results
+    return throughput
+
+def plan_run(image_folder_path, preprocess=None, max_batch_bytes=MAX_BATCH_BYTES,
+             max_batch_requests=MAX_BATCH_REQUESTS, manifest=None, concurrency=4, download_workers=4,
+             throughput=None, cache=None):
+    """Predict request sizes, batch packing and stage timings for submitting a folder
+
+    With a RunManifest, images already submitted are left out, as submit would.
+    The encoding cache (opened if it exists and none is given) supplies exact
+    sizes for images it already holds; the cache is only read.
+    Returns a plan dict; timing estimates are None where no past run recorded
+    the rate they need.
+    """
+    filenames, file_bytes = scan_image_folder(image_folder_path)
+    custom_ids = []
+    keep = np.ones(len(filenames), dtype=bool)
+    for i, filename in enumerate(filenames):
+        custom_id = manifest.custom_id_for(filename) if manifest is not None else None
+        if custom_id is None:
+            custom_id = create_short_custom_id(filename, i)
+        if manifest is not None and manifest.image_state(custom_id) not in (None, 'pending'):
+            keep[i] = False
+        custom_ids.append(custom_id)
+
+    if cache is None and os.path.isdir(DEFAULT_CACHE_DIR):
+        cache = EncodingCache()
+    kept = np.flatnonzero(keep)
+    payload_bytes = file_bytes.copy()
+    media_types = [None] * len(filenames)
+    cached = np.zeros(len(filenames), dtype=bool)
+    pixels = np.zeros(len(filenames), dtype=np.int64)
+    downscaled = np.zeros(len(filenames), dtype=bool)
+    for i in kept:
+        image_path = os.path.join(image_folder_path, filenames[i])
+        known = cache.cached_size(image_path, preprocess) if cache is not None else None
+        if known is not None:
+            payload_bytes[i], media_types[i] = known
+            cached[i] = True
+        else:
+            media_types[i] = get_image_media_type(image_path)
+        if preprocess:
+            pixels[i], downscaled[i] = output_pixels(image_path, preprocess)
+
+    bits_per_pixel = None
+    if preprocess:
+        # Calibrate on downscaled cached images: their re-encoded size is exactly known
+        calibration = cached & downscaled
+        bits_per_pixel = (8 * payload_bytes[calibration].sum() / pixels[calibration].sum()
+                          if calibration.any() else PREPROCESSED_BITS_PER_PIXEL)
+        estimated = np.flatnonzero(keep & ~cached)
+        reencoded = (pixels[estimated] * bits_per_pixel / 8).astype(np.int64)
+        # Downscaled images are always re-encoded; others only when that makes them smaller
+        use = downscaled[estimated] | (reencoded < file_bytes[estimated])
+        payload_bytes[estimated[use]] = reencoded[use]
+        for i in estimated[use]:
+            media_types[i] = get_image_media_type(None, preprocess.get('format', 'jpeg'))
+
+    request_bytes = np.zeros(len(filenames), dtype=np.int64)
+    envelopes = {}  # One serialized request per media type
+    for i in kept:
+        if media_types[i] not in envelopes:
+            envelopes[media_types[i]] = request_envelope_bytes(media_types[i])
+        request_bytes[i] = envelopes[media_types[i]] + len(custom_ids[i]) + base64_length(payload_bytes[i])
+    cached_count = int(cached.sum())
+    payload_bytes, request_bytes, file_bytes = payload_bytes[keep], request_bytes[keep], file_bytes[keep]
+
+    chunk_counts, chunk_bytes, oversized = plan_chunks(request_bytes, max_batch_bytes, max_batch_requests)
+    requests = int(chunk_counts.sum())
+    throughput = load_throughput() if throughput is None else throughput
+
+    def estimate(rate, amount, parallel):
+        return None if rate is None or not amount else rate * amount / max(1, min(parallel, len(chunk_counts)))
+
+    upload_rate = throughput.get('upload_bytes_per_sec')
+    return {
+        'images': len(filenames),
+        'already_submitted': int(len(filenames) - keep.sum()),
+        'requests': requests,
+        'oversized': oversized,
+        'file_bytes': int(file_bytes.sum()),
+        'payload_bytes': int(payload_bytes.sum()),
+        'request_bytes': int(request_bytes.sum()),
+        'max_request_bytes': int(request_bytes.max()) if len(request_bytes) else 0,
+        'batches': len(chunk_counts),
+        'batch_requests': chunk_counts.tolist(),
+        'batch_bytes': chunk_bytes.tolist(),
+        'preprocess': bool(preprocess),
+        'cached': cached_count,
+        'bits_per_pixel': bits_per_pixel,
+        'throughput': throughput,
+        'estimated_seconds': {
+            # Encoding runs alongside uploads during submit, so the slower of the two dominates
+            'encode': estimate(throughput.get('encode_sec_per_image'), requests, 1),
+            'submit': estimate(1 / upload_rate if upload_rate else None, int(chunk_bytes.sum()), concurrency),
+            # Batches are processed concurrently, so the largest batch sets the pace
+            'processing': estimate(throughput.get('processing_sec_per_request'),
+                                   int(chunk_counts.max()) if len(chunk_counts) else 0, 1),
+            'download': estimate(throughput.get('download_sec_per_result'), requests, download_workers),
+        },
+    }
+
+def format_duration(seconds):
+    if seconds is None:
+        return "unknown (no recorded throughput yet)"
+    if seconds < 60:
+        return f"{seconds:.1f}s"
+    if seconds < 3600:
+        return f"{seconds / 60:.1f} min"
+    return f"{seconds / 3600:.1f} h"
+
+def print_plan(plan):
+    print(f"🧮 {plan['images']} images, {plan['already_submitted']} already submitted: "
+          f"{plan['requests']} requests in {plan['batches']} batches")
+    label = "after preprocessing" if plan['preprocess'] else "as is"
+    print(f"   Images {plan['file_bytes'] / 1e6:,.1f} MB, uploaded {label}: {plan['payload_bytes'] / 1e6:,.1f} MB")
+    if plan['preprocess'] and plan['cached'] < plan['requests'] + plan['oversized']:
+        print(f"   ({plan['requests'] + plan['oversized'] - plan['cached']} payload sizes estimated at "
+              f"{plan['bits_per_pixel']:.2f} bits/pixel, {plan['cached']} exact from the encoding cache)")
+    if plan['requests']:
+        print(f"   Serialized requests: {plan['request_bytes'] / 1e6:,.1f} MB "
+              f"(avg {plan['request_bytes'] / plan['requests'] / 1e3:,.1f} KB, "
+              f"max {plan['max_request_bytes'] / 1e6:.2f} MB)")
+    if plan['batches']:
+        print(f"   Largest batch: {max(plan['batch_requests'])} requests, {max(plan['batch_bytes']) / 1e6:.1f} MB")
+    if plan['oversized']:
+        print(f"   ❌ {plan['oversized']} images would be skipped: too large for a single batch")
+    for stage, seconds in plan['estimated_seconds'].items():
+        print(f"   Estimated {stage + ':':<11} {format_duration(seconds)}")
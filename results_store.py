@@ -0,0 +1,161 @@
+import os
+import json
+import struct
+from collections import namedtuple
+
+import numpy as np
+
+from evaluate import extract_coordinates, response_text, PARSE_OK, PARSE_API_ERROR
+from mapping_store import IndexedLog
+
+DEFAULT_RESULTS_STORE = "geolocation_results_store"
+
+ResultEntry = namedtuple('ResultEntry', ['custom_id', 'run_id', 'status', 'pred_lat', 'pred_lon', 'line',
+                                         'previous', 'best'])
+
+# Data file (<path>.dat): append-only records, each a fixed header followed by
+# the custom_id, run_id and raw result line. Every result ever merged is kept;
+# each record links to the previous record for its custom_id (a short chain,
+# one per attempt) and to the record that currently wins for it, so the index
+# only ever points at the newest record of a custom_id.
+RECORD_HEADER = struct.Struct('<QQbddHHI')  # previous + 1, best, status, lat, lon, id len, run len, line len
+
+def parse_result_line(line):
+    """(custom_id, status, lat, lon) of one raw JSONL result line"""
+    result = json.loads(line)
+    text = response_text(result)
+    if text is None:
+        lat, lon, status = np.nan, np.nan, PARSE_API_ERROR
+    else:
+        lat, lon, status = extract_coordinates(text)
+    return result.get('custom_id', ''), status, lat, lon
+
+def wins(status, best_status):
+    """Latest-success-wins: a newer result replaces the best one unless it failed where that succeeded"""
+    return status == PARSE_OK or best_status != PARSE_OK
+
+class ResultsStore(IndexedLog):
+    """Every downloaded result, keyed by custom_id and run, merged with latest-success-wins
+
+    A run is whatever the results were downloaded from, normally a batch ID,
+    so resubmitted chunks and retry batches are separate runs of the same
+    custom_ids. Merging a result appends it and updates one index slot. The
+    best result per custom_id follows the rule of evaluate.latest_success_rows:
+    the newest successful result, else the newest one. lookup() reads a single
+    result through the index without scanning anything. Merging the same line
+    for the same run twice is a no-op, so re-downloading a batch is harmless.
+    """
+
+    def __init__(self, path=DEFAULT_RESULTS_STORE):
+        super().__init__(path)
+
+    def _read_record(self, offset):
+        """(ResultEntry, record length) at offset, or None if the record is incomplete"""
+        header = os.pread(self.data_fd, RECORD_HEADER.size, offset)
+        if len(header) < RECORD_HEADER.size:
+            return None
+        previous, best, status, lat, lon, id_len, run_len, line_len = RECORD_HEADER.unpack(header)
+        body = os.pread(self.data_fd, id_len + run_len + line_len, offset + RECORD_HEADER.size)
+        if len(body) < id_len + run_len + line_len:
+            return None
+        entry = ResultEntry(
+            body[:id_len].decode('utf-8'),
+            body[id_len:id_len + run_len].decode('utf-8'),
+            status, lat, lon,
+            body[id_len + run_len:].decode('utf-8'),
+            previous - 1 if previous else None,
+            best
+        )
+        return entry, RECORD_HEADER.size + id_len + run_len + line_len
+
+    def _entry(self, offset):
+        return self._read_record(offset)[0]
+
+    def history(self, custom_id):
+        """Every result for custom_id, newest first"""
+        entry = self._find(custom_id)
+        while entry is not None:
+            yield entry
+            entry = self._entry(entry.previous) if entry.previous is not None else None
+
+    def merge_line(self, line, run_id=""):
+        """Merge one raw JSONL result line
+
+        Returns True if it became the best result for its custom_id, False if
+        not, and None if this run already had exactly this line.
+        """
+        line = line.rstrip('\r\n')
+        custom_id, status, lat, lon = parse_result_line(line)
+        head_offset = self._find_offset(custom_id)
+        offset = self._header()[4]  # The record is appended at the current end of the data file
+        if head_offset is None:
+            previous, best = 0, offset
+        else:
+            if any(entry.run_id == run_id and entry.line == line for entry in self.history(custom_id)):
+                return None
+            best = self._entry(head_offset).best
+            previous = head_offset + 1
+            if wins(status, self._entry(best).status):
+                best = offset
+
+        id_bytes = custom_id.encode('utf-8')
+        run_bytes = run_id.encode('utf-8')
+        line_bytes = line.encode('utf-8')
+        record = RECORD_HEADER.pack(previous, best, status, lat, lon, len(id_bytes), len(run_bytes),
+                                    len(line_bytes)) + id_bytes + run_bytes + line_bytes
+        self._append(custom_id, record)
+        return best == offset
+
+    def merge_jsonl(self, results_file, run_id=""):
+        """Stream a JSONL results file into the store; returns (lines merged, lines that became the best result)
+
+        Blank and malformed lines, and lines this run already merged, are skipped.
+        """
+        merged = improved = 0
+        with open(results_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    won = self.merge_line(line, run_id)
+                except ValueError:
+                    continue
+                if won is not None:
+                    merged += 1
+                    improved += won
+        return merged, improved
+
+    def lookup(self, custom_id, run_id=None):
+        """Best ResultEntry for custom_id, or its newest result from run_id; None if there is none"""
+        if run_id is not None:
+            return next((entry for entry in self.history(custom_id) if entry.run_id == run_id), None)
+        head = self._find(custom_id)
+        return None if head is None else self._entry(head.best)
+
+    def get(self, custom_id, default=None):
+        """Best result for custom_id as a parsed result dict"""
+        entry = self.lookup(custom_id)
+        return default if entry is None else json.loads(entry.line)
+
+    def entries(self):
+        """Best ResultEntry for every custom_id, in the order those results were merged"""
+        heads = [self._entry(offset) for offset in self._indexed_offsets()]
+        for best in sorted(head.best for head in heads):
+            yield self._entry(best)
+
+    def write_jsonl(self, output_file):
+        """Write the best result per custom_id as a results file that evaluation can read"""
+        count = 0
+        tmp_path = output_file + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as out:
+            for entry in self.entries():
+                out.write(entry.line + '\n')
+                count += 1
+        os.replace(tmp_path, output_file)
+        return count
+
+if __name__ == "__main__":
+    # Usage: python results_store.py <results.jsonl>...  (or: python cli.py merge <results.jsonl>...)
+    import sys
+    from cli import main
+    sys.exit(main(['merge'] + sys.argv[1:]))
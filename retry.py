@@ -0,0 +1,145 @@
+import os
+import json
+import asyncio
+from collections import Counter
+
+from evaluate import latest_success_rows, STATUS_NAMES, PARSE_OK
+from manifest import RunManifest, DEFAULT_MANIFEST_FILE
+from mapping_store import load_filename_mapping
+
+DEFAULT_ERRORS_DIR = "errors"
+FAILED_RESULTS_FILE = "failed_results.jsonl"
+MAX_ATTEMPTS = 3  # Submissions per image, counting the original one
+
+def collect_failures(results_file="geolocation_results.jsonl", mapping_file="filename_mapping.json",
+                     manifest=None, workers=None):
+    """Every custom_id whose best result is an API error or has no usable coordinates
+
+    With a RunManifest, images whose batch was downloaded but that have no
+    result line at all (e.g. expired or canceled requests) are included as
+    'missing'. Returns a list of {custom_id, filename, status} dicts.
+    """
+    from sharded_parser import parse_results_sharded
+
+    parsed = parse_results_sharded(results_file, workers=workers)
+    keep = latest_success_rows(parsed['custom_id'], parsed['status'])
+    custom_ids = parsed['custom_id'][keep]
+    status = parsed['status'][keep]
+    with load_filename_mapping(mapping_file) as filename_mapping:
+        failures = [
+            {'custom_id': str(custom_id), 'filename': filename_mapping.get(str(custom_id), str(custom_id)),
+             'status': STATUS_NAMES[code]}
+            for custom_id, code in zip(custom_ids[status != PARSE_OK], status[status != PARSE_OK])
+        ]
+
+    if manifest is not None:
+        seen = set(custom_ids.tolist())
+        for custom_id, entry in manifest.data['images'].items():
+            if entry['state'] == 'downloaded' and custom_id not in seen:
+                failures.append({'custom_id': custom_id, 'filename': entry['filename'], 'status': 'missing'})
+    return failures
+
+def write_failures(failures, errors_dir=DEFAULT_ERRORS_DIR):
+    """Record failures as JSONL under errors/ for inspection"""
+    os.makedirs(errors_dir, exist_ok=True)
+    path = os.path.join(errors_dir, FAILED_RESULTS_FILE)
+    with open(path, 'w') as f:
+        for failure in failures:
+            f.write(json.dumps(failure) + '\n')
+    return path
+
+def submission_counts(manifest):
+    """How many batches each custom_id has been submitted in"""
+    counts = Counter()
+    for batch in manifest.batch_ids():
+        counts.update(batch.get('custom_ids', []))
+    return counts
+
+def iter_retry_requests(failures, image_folder_path, workers=1, executor="thread", preprocess=None, cache=None):
+    """Rebuild requests for failed images under their original custom_ids
+
+    Results from retries then merge with the originals by custom_id. With the
+    same preprocess settings as the original run, an EncodingCache serves the
+    payloads without re-reading or re-encoding the images.
+    """
+    from encoding import iter_encoded_images, EncodeStats
+    from main import build_request
+    from metrics import metrics
+
+    stats = EncodeStats()
+    image_paths = [os.path.join(image_folder_path, failure['filename']) for failure in failures]
+    encoded = iter_encoded_images(image_paths, workers=workers, executor=executor, stats=stats,
+                                  preprocess=preprocess, cache=cache)
+    try:
+        for failure, (image_path, result, error) in zip(failures, encoded):
+            if error is not None:
+                print(f"Error processing {failure['filename']}: {error}")
+                continue
+            yield build_request(failure['custom_id'], result[0], result[1])
+    finally:
+        encoded.close()
+        stats.report()
+        metrics.observe('stage', stats.encode_seconds, stage='encode')
+        metrics.count('images_encoded', stats.images)
+        metrics.count('encode_errors', stats.errors)
+        if cache is not None:
+            cache.close()
+
+def retry_failed(image_folder_path, results_file="geolocation_results.jsonl", mapping_file="filename_mapping.json",
+                 max_attempts=MAX_ATTEMPTS, workers=1, executor="thread", preprocess=None, cache=None, max_concurrency=4,
+                 errors_dir=DEFAULT_ERRORS_DIR, dry_run=False):
+    """Resubmit only the failed or unparseable results as compact retry batches
+
+    Failures are written to errors/failed_results.jsonl. Images already
+    submitted max_attempts times are left out. Without preprocess, the
+    settings the original submit recorded in the manifest are used, so retries
+    hit the encoding cache and send the same payloads. Retry batches are
+    recorded in the run manifest, so `watch`/`download` fetch them and append
+    their results to results_file like any other batch. Evaluation then keeps
+    the best result per custom_id. Returns (batch_ids, failed_chunks).
+    """
+    from main import submit_batch_chunks_async
+
+    # Retries are downloaded by appending to the results file, which needs the manifest's bookkeeping
+    if not os.path.exists(DEFAULT_MANIFEST_FILE):
+        raise SystemExit(f"❌ Retrying needs the run manifest ({DEFAULT_MANIFEST_FILE}) from the original submit")
+    manifest = RunManifest()
+    failures = collect_failures(results_file, mapping_file, manifest)
+    path = write_failures(failures, errors_dir)
+    by_status = Counter(failure['status'] for failure in failures)
+    print(f"🔁 {len(failures)} failed results ({', '.join(f'{k}: {v}' for k, v in sorted(by_status.items())) or 'none'}); "
+          f"saved to {path}")
+
+    counts = submission_counts(manifest)
+    exhausted = [f for f in failures if counts[f['custom_id']] >= max_attempts]
+    if exhausted:
+        print(f"   Skipping {len(exhausted)} images already submitted {max_attempts} times")
+    failures = [f for f in failures if counts[f['custom_id']] < max_attempts]
+
+    submitted_preprocess = manifest.submitted_preprocess()
+    if preprocess is None:
+        preprocess = submitted_preprocess
+        if preprocess:
+            print(f"   Using the original submit's preprocessing: {preprocess}")
+    elif preprocess != submitted_preprocess:
+        print(f"⚠️  Preprocessing {preprocess} differs from the original submit's ({submitted_preprocess}); "
+              f"retries will not reuse cached encodings")
+
+    if not failures or dry_run:
+        if dry_run:
+            print(f"   Dry run: {len(failures)} images would be retried")
+        return [], []
+
+    requests = iter_retry_requests(failures, image_folder_path, workers=workers, executor=executor,
+                                   preprocess=preprocess, cache=cache)
+    batch_ids, failed_chunks = asyncio.run(submit_batch_chunks_async(
+        requests, max_concurrency=max_concurrency, first_chunk_num=manifest.next_chunk_num(),
+        on_submitted=lambda batch_info: manifest.record_batch(dict(batch_info, retry=True))))
+    print(f"✅ Submitted {sum(b['request_count'] for b in batch_ids)} retries in {len(batch_ids)} batches")
+    return batch_ids, failed_chunks
+
+if __name__ == "__main__":
+    # Usage: python retry.py <image_folder>  (or: python cli.py retry <image_folder>)
+    import sys
+    from cli import main
+    sys.exit(main(['retry'] + sys.argv[1:]))
@@ -0,0 +1,108 @@
+import os
+import json
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+from evaluate import extract_coordinates, response_text, PARSE_API_ERROR
+
+try:
+    import orjson
+    loads = orjson.loads
+except ImportError:  # orjson is an optional speedup
+    loads = json.loads
+
+# Files smaller than this are parsed in-process; a pool costs more than it saves
+MIN_PARALLEL_BYTES = 8 * 1024 * 1024
+
+def find_shard_boundaries(results_file, n_shards, start=0, end=None):
+    """Split bytes [start, end) of a JSONL file into n_shards ranges that each start and end on a line boundary
+
+    start must itself be at the beginning of a line.
+    """
+    if end is None:
+        end = os.path.getsize(results_file)
+    size = end - start
+    if size <= 0:
+        return []
+    boundaries = [start]
+    with open(results_file, 'rb') as f:
+        for i in range(1, n_shards):
+            target = start + size * i // n_shards
+            if target <= boundaries[-1]:
+                continue
+            f.seek(target)
+            f.readline()  # Advance to the start of the next full line
+            position = f.tell()
+            if position >= end:
+                break
+            if position > boundaries[-1]:
+                boundaries.append(position)
+    boundaries.append(end)
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+def parse_shard(results_file, start, end):
+    """Parse lines in [start, end) into columns (custom_id, pred_lat, pred_lon, status, bad_lines)"""
+    custom_ids = []
+    pred_lat = []
+    pred_lon = []
+    status = []
+    bad_lines = 0
+
+    with open(results_file, 'rb') as f:
+        f.seek(start)
+        remaining = end - start
+        while remaining > 0:
+            line = f.readline()
+            if not line:
+                break
+            remaining -= len(line)
+            if not line.strip():
+                continue
+            try:
+                result = loads(line)
+            except ValueError:
+                bad_lines += 1
+                continue
+            text = response_text(result)
+            if text is None:
+                lat, lon, code = np.nan, np.nan, PARSE_API_ERROR
+            else:
+                lat, lon, code = extract_coordinates(text)
+            custom_ids.append(result.get('custom_id', ''))
+            pred_lat.append(lat)
+            pred_lon.append(lon)
+            status.append(code)
+
+    return (np.array(custom_ids, dtype=str), np.array(pred_lat, dtype=np.float64),
+            np.array(pred_lon, dtype=np.float64), np.array(status, dtype=np.int8), bad_lines)
+
+def parse_results_sharded(results_file="geolocation_results.jsonl", workers=None, shards_per_worker=4,
+                          start=0, end=None):
+    """Parse a results JSONL file across a process pool into compact columns
+
+    The file is split into byte-range shards aligned to line boundaries. Each
+    worker parses its shards independently, and the columns are concatenated in
+    file order. Returns a dict of arrays: custom_id (fixed-width str), pred_lat,
+    pred_lon (float64), status (int8 parse status), plus a bad_lines count.
+    No per-row dicts are built. start/end limit parsing to a byte range, e.g.
+    only the lines appended since the last incremental evaluation.
+    """
+    workers = workers or os.cpu_count() or 1
+    if end is None:
+        end = os.path.getsize(results_file)
+
+    if workers <= 1 or end - start < MIN_PARALLEL_BYTES:
+        parts = [parse_shard(results_file, start, end)]
+    else:
+        shards = find_shard_boundaries(results_file, workers * shards_per_worker, start, end)
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            parts = list(pool.map(parse_shard, [results_file] * len(shards),
+                                  [s for s, _ in shards], [e for _, e in shards]))
+
+    return {
+        'custom_id': np.concatenate([p[0] for p in parts]),
+        'pred_lat': np.concatenate([p[1] for p in parts]),
+        'pred_lon': np.concatenate([p[2] for p in parts]),
+        'status': np.concatenate([p[3] for p in parts]),
+        'bad_lines': sum(p[4] for p in parts),
+    }
@@ -0,0 +1,185 @@
+import numpy as np
+
+from evaluate import EARTH_RADIUS_KM, THRESHOLDS_KM
+
+try:
+    from scipy.spatial import cKDTree
+except ImportError:  # Without scipy nearest-neighbour queries fall back to chunked brute force
+    cKDTree = None
+
+DEFAULT_CELL_DEG = 10.0
+BRUTE_FORCE_CHUNK = 1024  # Queries per block in the numpy fallback (block x points distance matrix)
+
+# Grid cells
+
+def cell_ids(lat, lon, cell_deg=DEFAULT_CELL_DEG):
+    """Equal-angle grid cell of each point as one int64 (row * columns + column); -1 where lat/lon is nan"""
+    lat = np.asarray(lat, dtype=np.float64)
+    lon = np.asarray(lon, dtype=np.float64)
+    columns = int(np.ceil(360.0 / cell_deg))
+    rows = int(np.ceil(180.0 / cell_deg))
+    valid = ~(np.isnan(lat) | np.isnan(lon))
+    row = np.clip(np.floor((np.where(valid, lat, 0) + 90.0) / cell_deg), 0, rows - 1).astype(np.int64)
+    col = np.clip(np.floor((np.where(valid, lon, 0) + 180.0) / cell_deg), 0, columns - 1).astype(np.int64)
+    return np.where(valid, row * columns + col, -1)
+
+def cell_bounds(cell_id, cell_deg=DEFAULT_CELL_DEG):
+    """(lat_min, lon_min) of the south-west corner of each cell"""
+    columns = int(np.ceil(360.0 / cell_deg))
+    cell_id = np.asarray(cell_id, dtype=np.int64)
+    return cell_id // columns * cell_deg - 90.0, cell_id % columns * cell_deg - 180.0
+
+def group_median(groups, values, n_groups):
+    """Median of values within each group (nan for empty groups), without a Python loop"""
+    order = np.lexsort((values, groups))
+    groups, values = groups[order], values[order]
+    counts = np.bincount(groups, minlength=n_groups)
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    medians = np.full(n_groups, np.nan)
+    present = counts > 0
+    lo = starts[present] + (counts[present] - 1) // 2
+    hi = starts[present] + counts[present] // 2
+    medians[present] = (values[lo] + values[hi]) / 2
+    return medians
+
+def cell_aggregates(table, cell_deg=DEFAULT_CELL_DEG, by='true', thresholds=THRESHOLDS_KM):
+    """Per-cell error statistics for a joined table (see evaluate.load_predictions)
+
+    Rows are binned by their true coordinates (by='true') or predicted ones
+    (by='pred'). Returns a dict of arrays, one entry per non-empty cell:
+    cell_id, lat_min, lon_min, count, parsed, median_km, mean_km, plus
+    accuracy_<t>km for each threshold. As in evaluate.summarize, accuracy is
+    over all rows in the cell and the error stats over parsed rows only.
+    """
+    cells = cell_ids(table[f'{by}_lat'], table[f'{by}_lon'], cell_deg)
+    distance_km = np.asarray(table['distance_km'], dtype=np.float64)
+    placed = cells >= 0
+    unique_cells, group = np.unique(cells[placed], return_inverse=True)
+    distance_km = distance_km[placed]
+    n = len(unique_cells)
+
+    parsed_mask = ~np.isnan(distance_km)
+    count = np.bincount(group, minlength=n)
+    parsed = np.bincount(group, weights=parsed_mask, minlength=n).astype(np.int64)
+    distance_sum = np.bincount(group[parsed_mask], weights=distance_km[parsed_mask], minlength=n)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean_km = np.where(parsed > 0, distance_sum / parsed, np.nan)
+
+    lat_min, lon_min = cell_bounds(unique_cells, cell_deg)
+    result = {
+        'cell_id': unique_cells,
+        'lat_min': lat_min,
+        'lon_min': lon_min,
+        'count': count,
+        'parsed': parsed,
+        'median_km': group_median(group[parsed_mask], distance_km[parsed_mask], n),
+        'mean_km': mean_km,
+    }
+    for threshold in thresholds:
+        hits = np.bincount(group, weights=parsed_mask & (np.nan_to_num(distance_km, nan=np.inf) <= threshold),
+                           minlength=n)
+        result[f'accuracy_{threshold}km'] = hits / count
+    return result
+
+def print_cell_report(aggregates, cell_deg=DEFAULT_CELL_DEG, top=10, min_count=5):
+    """Cells with the highest median error among those with at least min_count images"""
+    eligible = np.flatnonzero((aggregates['count'] >= min_count) & ~np.isnan(aggregates['median_km']))
+    worst = eligible[np.argsort(-aggregates['median_km'][eligible])][:top]
+    print(f"🗺️  {len(aggregates['cell_id'])} cells of {cell_deg:g}°; worst median error "
+          f"(cells with >= {min_count} images):")
+    for i in worst:
+        print(f"   lat {aggregates['lat_min'][i]:+6.1f}..{aggregates['lat_min'][i] + cell_deg:+6.1f}, "
+              f"lon {aggregates['lon_min'][i]:+7.1f}..{aggregates['lon_min'][i] + cell_deg:+7.1f}: "
+              f"{aggregates['count'][i]:4d} images, median {aggregates['median_km'][i]:7.1f} km")
+
+# Nearest neighbours on the sphere
+
+def to_unit_vectors(lat, lon):
+    lat = np.radians(np.asarray(lat, dtype=np.float64))
+    lon = np.radians(np.asarray(lon, dtype=np.float64))
+    cos_lat = np.cos(lat)
+    return np.column_stack([cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)])
+
+def chord_to_km(chord):
+    """Great-circle distance for a straight-line distance between unit vectors"""
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.clip(chord / 2, 0.0, 1.0))
+
+class SpatialIndex:
+    """k-nearest-neighbour index over points on the sphere
+
+    Points become 3D unit vectors, where straight-line (chord) distance orders
+    neighbours exactly as great-circle distance does. A scipy KD-tree answers
+    queries in O(log n) when available; otherwise queries run as chunked numpy
+    distance blocks. Points with nan coordinates are left out of the index.
+    """
+
+    def __init__(self, lat, lon):
+        lat = np.asarray(lat, dtype=np.float64)
+        lon = np.asarray(lon, dtype=np.float64)
+        self.rows = np.flatnonzero(~(np.isnan(lat) | np.isnan(lon)))  # Index position -> original row
+        self.points = to_unit_vectors(lat[self.rows], lon[self.rows])
+        self.tree = cKDTree(self.points) if cKDTree is not None else None
+
+    def __len__(self):
+        return len(self.rows)
+
+    def query(self, lat, lon, k=1):
+        """(distances_km, rows) of shape (n, k) for the k indexed points nearest each query point
+
+        rows index the arrays the index was built from. Query points with nan
+        coordinates get distance nan and row -1.
+        """
+        lat = np.atleast_1d(np.asarray(lat, dtype=np.float64))
+        lon = np.atleast_1d(np.asarray(lon, dtype=np.float64))
+        k = min(k, len(self.rows))
+        distances = np.full((len(lat), k), np.nan)
+        rows = np.full((len(lat), k), -1, dtype=np.int64)
+        valid = np.flatnonzero(~(np.isnan(lat) | np.isnan(lon)))
+        if k == 0 or len(valid) == 0:
+            return distances, rows
+
+        queries = to_unit_vectors(lat[valid], lon[valid])
+        if self.tree is not None:
+            chord, position = self.tree.query(queries, k=k)
+            chord = chord.reshape(len(valid), k)
+            position = position.reshape(len(valid), k)
+        else:
+            chord = np.empty((len(valid), k))
+            position = np.empty((len(valid), k), dtype=np.int64)
+            for start in range(0, len(valid), BRUTE_FORCE_CHUNK):
+                block = queries[start:start + BRUTE_FORCE_CHUNK]
+                # |a - b|^2 = 2 - 2 a.b for unit vectors
+                squared = np.maximum(2.0 - 2.0 * block @ self.points.T, 0.0)
+                nearest = np.argpartition(squared, k - 1, axis=1)[:, :k] if k < len(self.rows) \
+                    else np.tile(np.arange(len(self.rows)), (len(block), 1))
+                nearest_sq = np.take_along_axis(squared, nearest, axis=1)
+                order = np.argsort(nearest_sq, axis=1)
+                position[start:start + len(block)] = np.take_along_axis(nearest, order, axis=1)
+                chord[start:start + len(block)] = np.sqrt(np.take_along_axis(nearest_sq, order, axis=1))
+
+        distances[valid] = chord_to_km(chord)
+        rows[valid] = self.rows[position]
+        return distances, rows
+
+    def within(self, lat, lon, radius_km):
+        """Rows of indexed points within radius_km of one query point"""
+        chord = 2 * np.sin(min(radius_km / EARTH_RADIUS_KM, np.pi) / 2)
+        query = to_unit_vectors([lat], [lon])[0]
+        if self.tree is not None:
+            positions = np.array(sorted(self.tree.query_ball_point(query, chord)), dtype=np.int64)
+        else:
+            positions = np.flatnonzero(np.linalg.norm(self.points - query, axis=1) <= chord)
+        return self.rows[positions]
+
+def ground_truth_index(table):
+    """SpatialIndex over the true coordinates of a joined table"""
+    return SpatialIndex(table['true_lat'], table['true_lon'])
+
+def nearest_ground_truth(table, k=5, index=None):
+    """For every prediction, the k ground-truth images nearest to it: (distances_km, rows)
+
+    rows index the table, so table['filename'][rows] names the images.
+    """
+    if index is None:
+        index = ground_truth_index(table)
+    return index.query(table['pred_lat'], table['pred_lon'], k)
@@ -0,0 +1,153 @@
+import os
+import re
+import json
+import numpy as np
+
+from main import (build_request, create_short_custom_id, list_image_files, DEFAULT_MODEL, DEFAULT_MAX_TOKENS,
+                  GEOLOCATION_PROMPT)
+from encoding import iter_encoded_images, EncodeStats
+from metrics import metrics
+
+# Sweep: the same images under several (model, prompt, max_tokens) variants.
+# Each image is read and encoded once and its payload is shared by every
+# variant's request. custom_ids are namespaced as <variant>-<image custom_id>,
+# so results from all variants can share one results file and split cleanly.
+#
+# Variants file (JSON list; missing fields fall back to the main.py defaults):
+#   [{"name": "sonnet"},
+#    {"name": "opus", "model": "claude-opus-4-20250514"},
+#    {"name": "short", "prompt": "Where was this photo taken? Answer as Latitude: <decimal> Longitude: <decimal>",
+#     "max_tokens": 100}]
+
+DEFAULT_VARIANTS_FILE = "sweep_variants.json"
+DEFAULT_SWEEP_MANIFEST = "sweep_manifest.json"
+DEFAULT_SWEEP_RESULTS = "sweep_results.jsonl"
+
+VARIANT_SEPARATOR = '-'  # Image custom_ids never contain it
+VARIANT_NAME = re.compile(r'^[A-Za-z0-9_]{1,16}$')
+MAX_CUSTOM_ID = 64
+
+def load_variants(variants_file=DEFAULT_VARIANTS_FILE):
+    """Read and validate a variants file into complete variant dicts"""
+    with open(variants_file, 'r') as f:
+        specs = json.load(f)
+    variants = []
+    for spec in specs:
+        name = spec.get('name', '')
+        if not VARIANT_NAME.match(name):
+            raise ValueError(f"Variant name {name!r} must be 1-16 letters, digits or underscores")
+        variants.append({
+            'name': name,
+            'model': spec.get('model', DEFAULT_MODEL),
+            'prompt': spec.get('prompt', GEOLOCATION_PROMPT),
+            'max_tokens': int(spec.get('max_tokens', DEFAULT_MAX_TOKENS)),
+        })
+    names = [v['name'] for v in variants]
+    if len(set(names)) != len(names):
+        raise ValueError(f"Duplicate variant names in {variants_file}")
+    return variants
+
+def variant_custom_id(variant_name, custom_id):
+    namespaced = f"{variant_name}{VARIANT_SEPARATOR}{custom_id}"
+    if len(namespaced) > MAX_CUSTOM_ID:
+        raise ValueError(f"custom_id {namespaced!r} is longer than {MAX_CUSTOM_ID} characters")
+    return namespaced
+
+def split_custom_ids(custom_ids):
+    """(variant names, image custom_ids) arrays from namespaced custom_ids"""
+    parts = np.char.partition(np.asarray(custom_ids).astype(str), VARIANT_SEPARATOR)
+    return parts[:, 0], parts[:, 2]
+
+def known_image_custom_id(manifest, filename):
+    """Image custom_id a sweep manifest already assigned to filename (under any variant), if any"""
+    namespaced = manifest.custom_id_for(filename) if manifest is not None else None
+    return None if namespaced is None else namespaced.partition(VARIANT_SEPARATOR)[2]
+
+def iter_sweep_requests(image_folder_path, variants, workers=1, executor="thread", preprocess=None, cache=None,
+                        manifest=None, mapping_store=None):
+    """Yield one request per (image, variant), encoding each image only once
+
+    All variants of an image are yielded back to back around one shared
+    payload string, so packed batches mix variants and fill to capacity
+    instead of leaving a part-empty tail batch per variant. With a
+    RunManifest, (image, variant) pairs already submitted are skipped, and
+    images whose variants are all submitted are not read at all. Images keep
+    the custom_id the manifest first gave them, so adding images to the
+    folder never renumbers (and resubmits) the ones already swept.
+    """
+    todo = []
+    for i, filename in enumerate(list_image_files(image_folder_path)):
+        custom_id = known_image_custom_id(manifest, filename) or create_short_custom_id(filename, i)
+        pending = []
+        for variant in variants:
+            namespaced = variant_custom_id(variant['name'], custom_id)
+            if manifest is not None:
+                manifest.add_image(namespaced, filename)
+                if manifest.image_state(namespaced) != 'pending':
+                    continue
+            pending.append((variant, namespaced))
+        if pending:
+            todo.append((custom_id, filename, pending))
+
+    print(f"Sweeping {len(variants)} variants: {sum(len(p) for _, _, p in todo)} requests "
+          f"from {len(todo)} images, each encoded once")
+
+    stats = EncodeStats()
+    encoded = iter_encoded_images([os.path.join(image_folder_path, filename) for _, filename, _ in todo],
+                                  workers=workers, executor=executor, stats=stats, preprocess=preprocess,
+                                  cache=cache)
+    try:
+        for (custom_id, filename, pending), (image_path, result, error) in zip(todo, encoded):
+            if error is not None:
+                print(f"Error processing {filename}: {error}")
+                continue
+            if mapping_store is not None and mapping_store.lookup(custom_id) is None:
+                mapping_store.put(custom_id, filename, cache.known_hash(image_path) if cache is not None else None)
+            for variant, namespaced in pending:
+                yield build_request(namespaced, result[0], result[1], model=variant['model'],
+                                    max_tokens=variant['max_tokens'], prompt=variant['prompt'])
+    finally:
+        encoded.close()
+        stats.report()
+        metrics.observe('stage', stats.encode_seconds, stage='encode')
+        metrics.count('images_encoded', stats.images)
+        metrics.count('encode_errors', stats.errors)
+        if cache is not None:
+            cache.close()
+        if manifest is not None:
+            manifest.save()
+        if mapping_store is not None:
+            mapping_store.flush()
+
+def load_variant_tables(results_file=DEFAULT_SWEEP_RESULTS, mapping_file="filename_mapping.json", workers=None):
+    """One joined table per variant of a sweep, keyed by the image custom_id; returns {variant: table}"""
+    from sharded_parser import parse_results_sharded
+    from evaluate import join_ground_truth, latest_success_rows
+    from mapping_store import load_filename_mapping
+
+    parsed = parse_results_sharded(results_file, workers=workers)
+    variant_names, image_ids = split_custom_ids(parsed['custom_id'])
+    tables = {}
+    with load_filename_mapping(mapping_file) as filename_mapping:
+        for name in np.unique(variant_names):
+            rows = np.flatnonzero(variant_names == name)
+            rows = rows[latest_success_rows(image_ids[rows], parsed['status'][rows])]
+            tables[str(name)] = join_ground_truth(image_ids[rows].tolist(), parsed['pred_lat'][rows],
+                                                  parsed['pred_lon'][rows], parsed['status'][rows], filename_mapping)
+    return tables
+
+def evaluate_sweep(results_file=DEFAULT_SWEEP_RESULTS, mapping_file="filename_mapping.json", workers=None):
+    """Score each variant of a sweep separately; returns {variant: summarize() metrics}"""
+    from evaluate import summarize
+
+    return {name: summarize(table['distance_km'], table['status'])
+            for name, table in load_variant_tables(results_file, mapping_file, workers).items()}
+
+def print_sweep_summary(summaries):
+    thresholds = next(iter(summaries.values()))['accuracy'].keys() if summaries else []
+    print(f"📊 {'variant':<16} {'n':>6} {'parsed':>6} {'median km':>10} "
+          + ' '.join(f"{t:>7}" for t in thresholds))
+    for name, s in summaries.items():
+        median = f"{s['median_km']:.1f}" if s['median_km'] is not None else '-'
+        print(f"   {name:<16} {s['total']:>6} {s['parsed']:>6} {median:>10} "
+              + ' '.join(f"{v:>7.1%}" if v is not None else f"{'-':>7}" for v in s['accuracy'].values()))